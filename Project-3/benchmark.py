@@ -0,0 +1,250 @@
+"""
+Throughput benchmarks for the chaos game, the variations and the fern.
+
+Every case is timed over a grid of n, r and step counts and reports
+points per second and peak memory. Results can be stored as a baseline
+and compared against later, e.g.
+
+    python benchmark.py --save baseline.json
+    python benchmark.py --compare baseline.json
+"""
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+
+import fern
+from chaos_game import ChaosGame
+from variations import Variations
+
+NS = [3, 5]
+RS = [1 / 2, 3 / 8]
+STEPS = [10**4, 10**5, 10**6]
+QUICK_STEPS = [10**4, 10**5]
+
+FERN_DEFINITION = os.path.join(os.path.dirname(os.path.abspath(__file__)), "barnsley_fern.json")
+VARIATIONS = ["linear", "handkerchief", "swirl", "disc", "heart", "ex",
+              "hyperbolic", "power", "fisheye"]
+
+
+def chaos_cases(steps_list):
+    """
+    Function listing the ChaosGame cases.
+
+    Arguments:
+    ----------
+        steps_list (list): step counts to run
+
+    Returns:
+    --------
+        [list]: (name, points, setup, run) for every case
+    """
+    cases = []
+    for n in NS:
+        for r in RS:
+            for steps in steps_list:
+                def setup(n=n, r=r):
+                    game = ChaosGame(n, r)
+                    game._starting_point()
+                    return game
+
+                def run_iterate(game, steps=steps):
+                    game.iterate(steps)
+
+                # iterate() also computes the gradient colors, so there is
+                # no separate case for _gradient_color().
+                tag = f"n={n},r={r:.3f},steps={steps}"
+                cases.append((f"iterate[{tag}]", steps, setup, run_iterate))
+    return cases
+
+
+def variation_cases(steps_list):
+    """
+    Function listing the Variations.transform cases, on a chaos game
+    point cloud of the given sizes.
+
+    Arguments:
+    ----------
+        steps_list (list): number of points to transform
+
+    Returns:
+    --------
+        [list]: (name, points, setup, run) for every case
+    """
+    cases = []
+    for steps in steps_list:
+        for name in VARIATIONS:
+            def setup(steps=steps, name=name):
+                game = ChaosGame(4, 1 / 3)
+                game._starting_point()
+                game.iterate(steps)
+                X = game.X_next
+                return Variations(X[:, 0], -X[:, 1], name)
+
+            def run(variation):
+                variation.transform()
+
+            cases.append((f"transform[{name},steps={steps}]", steps, setup, run))
+    return cases
+
+
+def fern_cases(steps_list):
+    """
+    Function listing the fern iterate cases.
+
+    Arguments:
+    ----------
+        steps_list (list): step counts to run
+
+    Returns:
+    --------
+        [list]: (name, points, setup, run) for every case
+    """
+    cases = []
+    for steps in steps_list:
+        def setup():
+            return fern.load_ifs(FERN_DEFINITION)
+
+        def run(ifs, steps=steps):
+            ifs.iterate(steps, 5)
+
+        cases.append((f"fern_iterate[steps={steps}]", steps, setup, run))
+    return cases
+
+
+def measure(points, setup, run, repeat=3):
+    """
+    Function timing one case, best of repeat runs, and measuring its
+    peak memory in a separate run with tracemalloc.
+
+    Arguments:
+    ----------
+        points (int): number of points produced by one run
+        setup (callable): gives the argument of run, not timed
+        run (callable): the code to time
+        repeat (int): number of timed runs
+
+    Returns:
+    --------
+        [dict]: seconds, points_per_sec and peak_mb of the case
+    """
+    best = np.inf
+    for _ in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        run(arg)
+        best = min(best, time.perf_counter() - start)
+
+    arg = setup()
+    tracemalloc.start()
+    run(arg)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": best, "points_per_sec": points / best,
+            "peak_mb": peak / 2**20}
+
+
+def selected(name, select):
+    """
+    Function matching a case name against a glob pattern, where * and ?
+    are wildcards and brackets match themselves, e.g.
+    "iterate[*steps=10000]" or "fern_iterate*".
+
+    Arguments:
+    ----------
+        name (string): name of the case
+        select (string): the pattern
+
+    Returns:
+    --------
+        [boolean expression]: True if the whole name matches
+    """
+    return fnmatch.fnmatchcase(name, select.replace("[", "[[]"))
+
+
+def run_all(quick=False, select=None, repeat=3):
+    """
+    Function running every case and printing one line per case.
+
+    Arguments:
+    ----------
+        quick (boolean expression): True skips the largest step count
+        select (string): only run cases whose name matches this glob,
+        see selected()
+        repeat (int): number of timed runs per case
+
+    Returns:
+    --------
+        [dict]: results per case name
+    """
+    steps_list = QUICK_STEPS if quick else STEPS
+    cases = chaos_cases(steps_list) + variation_cases(steps_list) + fern_cases(steps_list)
+    results = {}
+    for name, points, setup, run in cases:
+        if select is not None and not selected(name, select):
+            continue
+        results[name] = measure(points, setup, run, repeat)
+        r = results[name]
+        print(f"{name:55s} {r['points_per_sec']:14.4g} pts/s {r['peak_mb']:10.2f} MB")
+    return results
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Function comparing results with a stored baseline, flagging cases
+    that got slower or use more memory than the tolerance allows.
+
+    Arguments:
+    ----------
+        results (dict): results of this run
+        baseline (dict): results loaded from a baseline file
+        tolerance (float): allowed relative change
+
+    Returns:
+    --------
+        [list]: names of the cases that regressed
+    """
+    regressed = []
+    for name, r in results.items():
+        if name not in baseline:
+            continue
+        b = baseline[name]
+        speed = r["points_per_sec"] / b["points_per_sec"]
+        memory = r["peak_mb"] / b["peak_mb"] if b["peak_mb"] > 0 else 1.0
+        flag = ""
+        if speed < 1 - tolerance or memory > 1 + tolerance:
+            flag = "  REGRESSION"
+            regressed.append(name)
+        print(f"{name:55s} speed x{speed:6.2f}  memory x{memory:6.2f}{flag}")
+    return regressed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="skip the largest step count")
+    parser.add_argument("--select", help="only run cases whose name matches this glob")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case")
+    parser.add_argument("--save", help="store the results as a baseline JSON file")
+    parser.add_argument("--compare", help="compare with a baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative slowdown or memory growth")
+    args = parser.parse_args()
+
+    results = run_all(args.quick, args.select, args.repeat)
+
+    if args.save:
+        with open(args.save, "w") as outfile:
+            json.dump({"machine": platform.platform(), "numpy": np.__version__,
+                       "results": results}, outfile, indent=2)
+
+    if args.compare:
+        with open(args.compare) as infile:
+            baseline = json.load(infile)["results"]
+        regressed = compare(results, baseline, args.tolerance)
+        if regressed:
+            raise SystemExit(f"{len(regressed)} case(s) regressed")
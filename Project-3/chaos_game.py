@@ -1,5 +1,131 @@
+import functools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import matplotlib.pyplot as plt
 import numpy as np
+from density import DensityGrid, estimate_extent
+
+
+def _affine_scan(x0, a, u):
+    """
+    Function solving the linear recurrence y_i = a*y_{i-1} + u_i,
+    with y_{-1} = x0, without a Python loop over the points.
+
+    The points are split into blocks short enough that a**(-B) does not
+    overflow. Inside a block the recurrence is a scaled cumulative sum,
+    and the value carried between blocks is itself a recurrence with
+    factor a**B, which is solved the same way.
+
+    Arguments:
+    ----------
+        x0 (ndarray): value before the first point
+        a (float): contraction factor, 0 < a < 1
+        u (ndarray): inputs, one row per point
+
+    Returns:
+    --------
+        [ndarray]: Array y with the same shape as u
+    """
+    u = np.asarray(u, dtype=float)
+    x0 = np.asarray(x0, dtype=float)
+    N = len(u)
+    if N == 0:
+        return u.copy()
+
+    if a < np.finfo(float).eps:
+        # Older points no longer contribute, only the latest one does.
+        y = u.copy()
+        y[0] += a * x0
+        y[1:] += a * u[:-1]
+        return y
+
+    B = int(min(N, max(2, np.log(1e150) // -np.log(a))))
+    nb = -(-N // B)
+    tail = (1,) * (u.ndim - 1)
+
+    U = np.zeros((nb * B,) + u.shape[1:])
+    U[:N] = u
+    U = U.reshape((nb, B) + u.shape[1:])
+
+    powers = a ** np.arange(B, dtype=float)
+    local = np.cumsum(U * (1 / powers).reshape((1, B) + tail), axis=1)
+    local *= powers.reshape((1, B) + tail)
+
+    if nb == 1:
+        starts = x0[np.newaxis]
+    else:
+        starts = np.empty((nb,) + u.shape[1:])
+        starts[0] = x0
+        starts[1:] = _affine_scan(x0, a ** B, local[:-1, -1])
+
+    local += (a * powers).reshape((1, B) + tail) * starts[:, np.newaxis]
+    return local.reshape((nb * B,) + u.shape[1:])[:N]
+
+
+@functools.lru_cache(maxsize=None)
+def _ngon(n):
+    """
+    Function computing the angles and vertices of a regular n-gon in
+    closed form, cached per n. The arrays are read-only since every
+    game with the same n shares them.
+
+    Arguments:
+    ----------
+        n (int): number of vertices
+
+    Returns:
+    --------
+        [ndarray]: angles theta of the vertices
+        [ndarray]: vertices, shape (n, 2)
+    """
+    theta = np.linspace(0, 2 * np.pi, n, endpoint=False)
+    c_marked = np.column_stack((np.sin(theta), np.cos(theta)))
+    theta.flags.writeable = False
+    c_marked.flags.writeable = False
+    return theta, c_marked
+
+
+def _draw_corners(rng, n, size):
+    """
+    Function drawing corner indices, from the global NumPy state when
+    rng is None and from the given Generator otherwise.
+
+    Arguments:
+    ----------
+        rng (Generator): random stream, or None
+        n (int): number of vertices
+        size (int): number of indices
+
+    Returns:
+    --------
+        [ndarray]: Array of ints in 0 <= k < n
+    """
+    if rng is None:
+        return np.random.randint(n, size=size)
+    return rng.integers(n, size=size)
+
+
+def _render_chain(n, r, steps, discard, width, chunk, seed):
+    """
+    Function running one chain of the game in a worker process with
+    its own random stream.
+
+    Arguments:
+    ----------
+        n, r: parameters of the ChaosGame
+        steps, discard, width, chunk: passed on to ChaosGame.render
+        seed (SeedSequence): seed of the chain's Generator
+
+    Returns:
+    --------
+        [DensityGrid]: the grid of this chain
+    """
+    game = ChaosGame(n, r)
+    rng = np.random.default_rng(seed)
+    game._starting_point(rng=rng)
+    return game.render(steps, discard, width, chunk, rng=rng)
 
 
 class ChaosGame:
@@ -29,11 +155,14 @@ class ChaosGame:
         else:
             raise ValueError("Needs to be float type and between 0 and 1!")
 
+        self.grid = None
+        self.X_next = None
         self._generate_ngon()
 
     def _generate_ngon(self):
         """
-        Private method computing the n-gon
+        Private method computing the n-gon. The vertex table is shared
+        between all games with the same n, see _ngon().
 
         Variables:
         ----------
@@ -44,46 +173,105 @@ class ChaosGame:
             None, only stores the calculated theta and c_marked values
             for potential further usage
         """
-        theta = np.linspace(0, 2 * np.pi, self.n, endpoint=False)
-        c_marked = np.zeros((len(theta), 2))
-        for j in range(0, self.n):
-            c_marked[j][0] = np.sin(theta[j])
-            c_marked[j][1] = np.cos(theta[j])
-        self._theta = theta
-        self._c_marked = c_marked
+        self._theta, self._c_marked = _ngon(self.n)
 
-    def _starting_point(self):
+    def starting_points(self, count, rng=None):
+        """
+        Method drawing many starting points at once, as random convex
+        combinations of the vertices with Dirichlet weights.
+
+        Arguments:
+        ----------
+            count (int): number of starting points
+            rng (Generator): random stream, the global NumPy state
+            is used if None
+
+        Returns:
+        --------
+            [ndarray]: Array of shape (count, 2)
+        """
+        w = (np.random if rng is None else rng).dirichlet(np.ones(self.n), size=count)
+        return w @ self._c_marked
+
+    def _starting_point(self, rng=None):
         """
         Private method computing the starting point
 
+        Arguments:
+        ----------
+            rng (Generator): random stream, the global NumPy state
+            is used if None
+
         Variables:
         ----------
-            n (int): number of vertices
-            w (ndarray): Array for random values in intervall 0 <= w < 1
-            norm(ndarray): array w normalized
+            X_start (ndarray): a random point inside the n-gon
         Returns:
         --------
             None, only stores the calculated starting point
         """
-        n = self.n
-        w = np.random.random(n)
-        norm = w/sum(w)
+        self.X_start = self.starting_points(1, rng)[0]
+        self.X = self.X_start
 
-        self.X_start = [0, 0]
-        for i in range(0, len(w)):
-            self.X_start = (self.X_start + self._c_marked[i] * norm[i])
+    def chunks(self, steps=None, discard=5, chunk=2**16, rng=None):
+        """
+        Generator yielding the points of the game in fixed size chunks,
+        so any number of steps runs in constant memory. The loop can be
+        stopped at any time by leaving it.
 
-        self.X = self.X_start
+        Arguments:
+        ----------
+            steps (int): number of points to yield, None runs forever
+            discard (int): number of ignored points at start
+            chunk (int): largest number of points per chunk
+            rng (Generator): random stream, the global NumPy state
+            is used if None
 
-    def iterate(self, steps, discard=5):
+        Yields:
+        --------
+            [tuple]: (X, colors, C), X of shape (m, 2), the corner
+            index that produced every point and the gradient color
+            C_{i+1} = (C_i + k)/2, computed in the same pass
+        """
+        x = np.array(self.X_start, dtype=float)
+        c = np.zeros(())
+        if discard == 0:
+            if steps is not None and steps <= 0:
+                return
+            yield x[np.newaxis].copy(), np.zeros(1, dtype=int), np.zeros(1)
+            if steps is not None:
+                steps -= 1
+
+        skip = max(0, discard - 1)
+        while skip > 0:
+            size = min(chunk, skip)
+            k = _draw_corners(rng, self.n, size)
+            x = _affine_scan(x, self.r, (1 - self.r) * self._c_marked[k])[-1]
+            c = _affine_scan(c, 0.5, 0.5 * k)[-1]
+            skip -= size
+
+        while steps is None or steps > 0:
+            size = chunk if steps is None else min(chunk, steps)
+            k = _draw_corners(rng, self.n, size)
+            points = _affine_scan(x, self.r, (1 - self.r) * self._c_marked[k])
+            C = _affine_scan(c, 0.5, 0.5 * k)
+            x = points[-1]
+            c = C[-1]
+            if steps is not None:
+                steps -= size
+            yield points, k, C
+
+    def iterate(self, steps, discard=5, chunk=2**16):
         """
         Method computing several points inside our n-gon
-        with a specialized formula.
+        with a specialized formula. The corners are drawn in bulk and
+        the recurrence X_{i+1} = r*X_i + (1 - r)*c_k is advanced one
+        chunk at a time, see chunks().
 
         Arguments:
         ----------
             steps (int): number of iterations
             discard (int): number of ignored points at start
+            chunk (int): number of points computed per vectorized pass
 
         Variables:
         ----------
@@ -91,23 +279,333 @@ class ChaosGame:
             X_next (ndarray): Array for calculated values
             colors(ndarray): Array that memorizes an integer
             associated with a calculated point
+            C (ndarray): Gradient color of every point
         Returns:
         --------
-            None, only stores the calculated points and color array
-        """
-        x0 = self.X
-        X_next = np.zeros((steps + discard, 2))
-        X_next[0] = np.array(x0)
-        colors = np.zeros(steps + discard)
-
-        for i in range(0, steps + (discard - 1)):
-            k = np.random.randint(self.n)
-            corner = self._c_marked[k]
-            X_next[i + 1] = self.r * X_next[i] + (1 - self.r) * corner
-            colors[i + 1] = k
+            None, only stores the calculated points and color arrays
+        """
+        X_next = np.zeros((steps, 2))
+        colors = np.zeros(steps)
+        C = np.zeros(steps)
+
+        start = 0
+        for points, k, c in self.chunks(steps, discard, chunk):
+            X_next[start:start + len(k)] = points
+            colors[start:start + len(k)] = k
+            C[start:start + len(k)] = c
+            start += len(k)
         self.steps = steps
-        self.X_next = X_next[discard:]
-        self.colors = colors[discard:]
+        self.X_next = X_next
+        self.colors = colors
+        self.C = C
+
+    def render(self, steps, discard=5, width=500, chunk=2**16, grid=None,
+               rng=None, filename=None, extent=None, stage=None):
+        """
+        Method binning the points into a DensityGrid while they are
+        generated, instead of storing them. Cost and memory depend on
+        the image resolution and the chunk size, not on steps.
+
+        Arguments:
+        ----------
+            steps (int): number of iterations
+            discard (int): number of ignored points at start
+            width (int): number of pixels along x
+            chunk (int): number of points computed per vectorized pass
+            grid (DensityGrid): grid to add to, a new one covering the
+            n-gon is made if None
+            rng (Generator): random stream, the global NumPy state
+            is used if None
+            filename (string): if given, a new grid keeps its counts in
+            this memory mapped .npy file, for renders too big for RAM
+            extent (tuple): window (xmin, xmax, ymin, ymax) of a new
+            grid, the whole n-gon if None, or estimated from a short run
+            through the stage. Points outside are dropped.
+            stage (callable): optional step between the game and the
+            grid, taking the stream of chunks and giving a new one,
+            e.g. lambda chunks: Variations.stream(chunks, "disc")
+
+        Variables:
+        ----------
+            grid (DensityGrid): counts, and the gradient color summed
+            per pixel for colored images
+        Returns:
+        --------
+            [DensityGrid]: the grid, also stored as self.grid
+        """
+        if grid is None:
+            if extent is None and stage is not None:
+                extent = self._estimate_extent(stage, discard, rng)
+            elif extent is None:
+                extent = self._extent()
+            grid = DensityGrid(extent, width, filename=filename)
+        chunks = self.chunks(steps, discard, chunk, rng)
+        if stage is not None:
+            chunks = stage(chunks)
+        for points, k, C in chunks:
+            grid.add(points, C)
+        self.grid = grid
+        return grid
+
+    def render_until(self, tol=1e-2, width=500, discard=5, chunk=2**16,
+                     first_check=2**18, max_steps=10**9, rng=None):
+        """
+        Method rendering progressively until the image stops changing.
+        Points are added chunk by chunk and checkpoints are taken each
+        time the number of points has doubled. At every checkpoint the
+        normalized density is compared with the one at the previous
+        checkpoint, and the render stops once the L1 change is below tol.
+
+        Arguments:
+        ----------
+            tol (float): largest accepted L1 change of the normalized
+            density between two checkpoints, between 0 and 2
+            width (int): number of pixels along x
+            discard (int): number of ignored points at start
+            chunk (int): number of points computed per vectorized pass
+            first_check (int): number of points at the first checkpoint
+            max_steps (int): stop here even if tol is not reached
+            rng (Generator): random stream, the global NumPy state
+            is used if None
+
+        Variables:
+        ----------
+            convergence (dict): steps used, seconds spent, the last
+            change and whether tol was reached
+        Returns:
+        --------
+            [DensityGrid]: the grid, also stored as self.grid
+        """
+        start = time.perf_counter()
+        grid = DensityGrid(self._extent(), width)
+        previous = None
+        change = np.inf
+        checkpoint = first_check
+        for points, k, C in self.chunks(None, discard, chunk, rng):
+            grid.add(points, C)
+            done = grid.total >= max_steps
+            if grid.total >= checkpoint or done:
+                density = grid.counts / grid.total
+                if previous is not None:
+                    change = np.abs(density - previous).sum()
+                previous = density
+                checkpoint *= 2
+                if change < tol or done:
+                    break
+
+        self.convergence = {"steps": grid.total,
+                            "seconds": time.perf_counter() - start,
+                            "change": float(change),
+                            "converged": bool(change < tol)}
+        self.grid = grid
+        return grid
+
+    def render_parallel(self, steps, chains=None, processes=None, discard=5,
+                        width=500, chunk=2**16, seed=None):
+        """
+        Method splitting the steps over several independent chains,
+        each started from its own _starting_point() and run with its
+        own Generator spawned from one SeedSequence. The chains run in
+        a process pool and their grids are merged into one.
+
+        Arguments:
+        ----------
+            steps (int): total number of points over all chains
+            chains (int): number of chains, defaults to the number of cores
+            processes (int): size of the process pool, 1 runs the chains
+            in this process
+            discard (int): number of ignored points at the start of
+            every chain
+            width (int): number of pixels along x
+            chunk (int): number of points computed per vectorized pass
+            seed (int): seed of the SeedSequence, None gives fresh entropy
+
+        Returns:
+        --------
+            [DensityGrid]: the merged grid, also stored as self.grid
+        """
+        if chains is None:
+            chains = os.cpu_count() or 1
+        seeds = np.random.SeedSequence(seed).spawn(chains)
+        shares = [steps // chains + (i < steps % chains) for i in range(chains)]
+        jobs = [(self.n, self.r, share, discard, width, chunk, s)
+                for share, s in zip(shares, seeds)]
+
+        if processes == 1:
+            grids = [_render_chain(*job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                grids = list(pool.map(_render_chain, *zip(*jobs)))
+
+        grid = grids[0]
+        for other in grids[1:]:
+            grid.merge(other)
+        self.grid = grid
+        return grid
+
+    def enumerate_points(self, depth, max_points=2**20, extent=None):
+        """
+        Generator building every point of depth k deterministically,
+        without a random walk. A point with address (a_1, ..., a_k) is
+        f_{a_1}(f_{a_2}(...f_{a_k}(0))), with f_j(x) = r*x + (1 - r)*c_j.
+        The addresses are expanded one level at a time by broadcasting
+        over the vertices. When a level would hold more than max_points
+        points, the branches are split and finished one after another.
+        With an extent, branches whose part of the attractor cannot
+        reach the window are dropped as soon as they are built.
+
+        Arguments:
+        ----------
+            depth (int): number of contractions k, gives n**k points
+            max_points (int): largest number of points held at once
+            extent (tuple): optional window (xmin, xmax, ymin, ymax)
+
+        Yields:
+        --------
+            [tuple]: (X, colors), the points and the vertex a_1 that
+            was moved towards last
+        """
+        offsets = np.zeros((1, 2))
+        yield from self._descend(offsets, None, 1.0, depth, max_points, extent)
+
+    def _descend(self, offsets, colors, scale, depth, max_points, extent=None):
+        """
+        Private generator expanding a set of address prefixes depth
+        more levels. A prefix maps y to scale*y + offset, so appending
+        vertex j gives the offset + scale*(1 - r)*c_j.
+
+        Arguments:
+        ----------
+            offsets (ndarray): image of 0 under every prefix, shape (m, 2)
+            colors (ndarray): first vertex of every prefix, None for
+            the empty prefix
+            scale (float): r**(length of the prefixes)
+            depth (int): number of levels left
+            max_points (int): largest number of points held at once
+            extent (tuple): optional window, see _visible()
+
+        Yields:
+        --------
+            [tuple]: (X, colors) of the finished points
+        """
+        n = self.n
+        steps = (1 - self.r) * self._c_marked
+        while depth > 0:
+            if len(offsets) * n > max_points and len(offsets) > 1:
+                size = max(1, max_points // n)
+                for i in range(0, len(offsets), size):
+                    yield from self._descend(offsets[i:i + size],
+                                             colors[i:i + size],
+                                             scale, depth, max_points, extent)
+                return
+            offsets = (offsets[:, np.newaxis] + scale * steps).reshape(-1, 2)
+            if colors is None:
+                colors = np.arange(n)
+            else:
+                colors = np.repeat(colors, n)
+            scale *= self.r
+            depth -= 1
+            if extent is not None:
+                keep = self._visible(offsets, scale, extent)
+                offsets = offsets[keep]
+                colors = colors[keep]
+        if colors is None:
+            colors = np.zeros(len(offsets), dtype=int)
+        yield offsets, colors
+
+    @staticmethod
+    def _visible(offsets, scale, extent):
+        """
+        Private method finding the prefixes whose part of the attractor
+        can land inside a window. The attractor lies in the unit disk,
+        since it is inside the n-gon, so a prefix y -> scale*y + offset
+        keeps it inside the disk of radius scale around offset.
+
+        Arguments:
+        ----------
+            offsets (ndarray): image of 0 under every prefix, shape (m, 2)
+            scale (float): contraction of the prefixes
+            extent (tuple): window (xmin, xmax, ymin, ymax)
+
+        Returns:
+        --------
+            [ndarray]: Boolean mask of the prefixes to keep
+        """
+        xmin, xmax, ymin, ymax = extent
+        x = offsets[:, 0]
+        y = offsets[:, 1]
+        dx = np.maximum(np.maximum(xmin - x, x - xmax), 0)
+        dy = np.maximum(np.maximum(ymin - y, y - ymax), 0)
+        return dx**2 + dy**2 <= scale**2
+
+    def render_deterministic(self, depth=None, width=500, max_points=2**20,
+                             filename=None, extent=None):
+        """
+        Method binning all n**depth points from enumerate_points() into
+        a DensityGrid. Every point is within r**depth of the attractor,
+        so the image has no sampling noise. For a zoomed window only the
+        branches that can reach it are built, so a deep zoom costs about
+        as much as a full render at the same resolution.
+
+        Arguments:
+        ----------
+            depth (int): number of contractions, if None the smallest
+            depth with r**depth below one pixel is used
+            width (int): number of pixels along x
+            max_points (int): largest number of points held at once
+            filename (string): if given, the counts are kept in this
+            memory mapped .npy file
+            extent (tuple): window (xmin, xmax, ymin, ymax) to render,
+            the whole n-gon if None
+
+        Returns:
+        --------
+            [DensityGrid]: the grid, also stored as self.grid
+        """
+        if extent is None:
+            extent = self._extent()
+        grid = DensityGrid(extent, width, filename=filename)
+        if depth is None:
+            pixel = (grid.extent[1] - grid.extent[0]) / grid.width
+            depth = max(1, int(np.ceil(np.log(pixel) / np.log(self.r))))
+        for points, colors in self.enumerate_points(depth, max_points, extent):
+            grid.add(points, colors)
+        self.grid = grid
+        return grid
+
+    def _estimate_extent(self, stage, discard=5, rng=None, steps=2**16):
+        """
+        Private method estimating a window holding almost all of the
+        points after a stage from a short run, see estimate_extent(), as
+        the transformed points need not stay in the n-gon.
+
+        Arguments:
+        ----------
+            stage (callable): step between the game and the grid
+            discard (int): number of ignored points at start
+            rng (Generator): random stream, the global NumPy state
+            is used if None
+            steps (int): number of points in the run
+
+        Returns:
+        --------
+            [tuple]: (xmin, xmax, ymin, ymax)
+        """
+        X = np.concatenate([c[0] for c in stage(self.chunks(steps, discard, rng=rng))])
+        return estimate_extent(X)
+
+    def _extent(self):
+        """
+        Private method giving the bounding box of the n-gon, which
+        contains every point of the game.
+
+        Returns:
+        --------
+            [tuple]: (xmin, xmax, ymin, ymax)
+        """
+        low = self._c_marked.min(axis=0)
+        high = self._c_marked.max(axis=0)
+        return (low[0], high[0], low[1], high[1])
 
     def plot_ngon(self):
         """
@@ -129,31 +627,21 @@ class ChaosGame:
     def _gradient_color(self):
         """
         Private method colorizing our points in a gradient style.
+        The colors C_{i+1} = (C_i + k)/2 are computed together with the
+        points in iterate(), so this only hands them out.
 
         Variables:
         ----------
-            r (ndarray): Identity-matrix.
             C (ndarray): Array for memorizing integers associated with values.
-            X (ndarray): Array for points within our triangle.
+            X (ndarray): Array for points within our n-gon, same as X_next.
         Returns:
         --------
             self.C and self.X now contains values.
         """
-        r = np.identity(self.n)
-        C = np.zeros(self.steps)
-        X = np.zeros((self.steps, 2))
-
-        for i in range(0, self.steps - 1):
-            j = np.random.randint(self.n)
-            C[0] = j
-            corner = self._c_marked[j]
-            C[i + 1] = (C[i] + j) / 2
-            X[i + 1] = self.r * X[i] + (1 - self.r) * corner
-        self.C = C[5:]
-        self.X = X[5:]
+        self.X = self.X_next
         return self.C, self.X
 
-    def plot(self, color=True, cmap="jet"):
+    def plot(self, color=True, cmap="jet", density=False, gamma=2.2):
         """
         Method for plotting with and without color given
         certain circumstances. Within this code is two exercises,
@@ -164,10 +652,22 @@ class ChaosGame:
             color (boolean expression): False gives black color and true gives
             several colors.
             cmap (colormap): Certain set of colors.
+            density (boolean expression): True shows the tone mapped
+            grid from render() instead of scattering the points.
+            gamma (float): gamma correction of the density image
         Returns:
         --------
             None, only plots.
         """
+        if density:
+            if color:
+                image = self.grid.to_rgba(cmap=cmap, gamma=gamma)
+                plt.imshow(image, extent=self.grid.extent)
+            else:
+                image = self.grid.image(gamma=gamma)
+                plt.imshow(image, extent=self.grid.extent, cmap="gray_r")
+            return
+
         if color == False:
             plt.scatter(*zip(*self.X_next), s=0.1, marker=".", color= "black")
 
@@ -189,30 +689,48 @@ class ChaosGame:
             C, X = self._gradient_color()
             plt.scatter(*zip(*X), c=C, s=1)
 
-    def savepng(self, outfile, color=False, cmap="jet"):
+    def savepng(self, outfile, color=False, cmap="jet", source="figure"):
         """
-        Method for checking filetype and adding extension if necessary.
+        Method for checking filetype and adding extension if necessary,
+        then saving to exactly that path. What is saved is chosen by
+        source: the current matplotlib figure, the grid from the last
+        render() written straight to the file (a tone mapped .png or the
+        raw counts in a .npy), or the points from iterate() as a .npy.
 
         Variables:
         ----------
-            outfile (string): Name of our file we wish to save plot as.
-            color (boolean expression): False, does not change our color in
-            current circumstance.
+            outfile (string): Path of the file we wish to save as.
+            color (boolean expression): True writes the colored image
+            of the grid.
             cmap (colormap): Certain set of colors.
+            source (string): "figure", "grid" or "points"
         Returns:
         --------
-            None, only plots saves figure.
+            None, only saves the image.
         """
-        picture = outfile
-        if picture[-4:] == ".png":
-            plt.savefig(f"figures/{outfile}", dpi=300, transparent=True)
-
-        elif picture.find(".") == True:
-            raise TypeError("File is already an extensions!")
-
+        ext = os.path.splitext(outfile)[1]
+        if ext == "":
+            outfile = outfile + ".png"
+            ext = ".png"
+        if ext not in (".png", ".npy"):
+            raise ValueError(f"Extension {ext} not supported, use .png or .npy!")
+
+        if source == "grid":
+            if self.grid is None:
+                raise ValueError("No grid to save, call render() first!")
+            self.grid.save(outfile, color=color, cmap=cmap)
+        elif source == "points":
+            if self.X_next is None:
+                raise ValueError("No points to save, call iterate() first!")
+            if ext != ".npy":
+                raise ValueError("Points can only be saved as .npy!")
+            np.save(outfile, self.X_next)
+        elif source == "figure":
+            if ext != ".png":
+                raise ValueError("The figure can only be saved as .png!")
+            plt.savefig(outfile, dpi=300, transparent=True)
         else:
-            outline = outfile + ".png"
-            plt.savefig(f"figures/{outfile}", dpi=300, transparent=True)
+            raise ValueError("Source needs to be 'figure', 'grid' or 'points'!")
 
 
 if __name__ == "__main__":
@@ -225,7 +743,7 @@ if __name__ == "__main__":
     f._starting_point()
     f.iterate(steps = 20000, discard = 5)
     f.plot()
-    f.savepng(outfile = "chaos1.png")
+    f.savepng(outfile = "figures/chaos1.png")
     plt.show()
 
     g = ChaosGame(n = 4, r = 1/3)
@@ -233,7 +751,7 @@ if __name__ == "__main__":
     g._starting_point()
     g.iterate(steps = 20000, discard = 5)
     g.plot()
-    g.savepng(outfile = "chaos2.png")
+    g.savepng(outfile = "figures/chaos2.png")
     plt.show()
 
     h = ChaosGame(n = 5, r = 1/3)
@@ -241,7 +759,7 @@ if __name__ == "__main__":
     h._starting_point()
     h.iterate(steps = 20000, discard = 5)
     h.plot()
-    h.savepng(outfile = "chaos3.png")
+    h.savepng(outfile = "figures/chaos3.png")
     plt.show()
 
     j = ChaosGame(n = 5, r = 3/8)
@@ -249,7 +767,7 @@ if __name__ == "__main__":
     j._starting_point()
     j.iterate(steps = 20000, discard = 5)
     j.plot()
-    j.savepng(outfile = "chaos4.png")
+    j.savepng(outfile = "figures/chaos4.png")
     plt.show()
 
     k = ChaosGame(n = 6, r = 1/3)
@@ -257,7 +775,7 @@ if __name__ == "__main__":
     k._starting_point()
     k.iterate(steps = 20000, discard = 5)
     k.plot()
-    k.savepng(outfile = "chaos5.png")
+    k.savepng(outfile = "figures/chaos5.png")
 
     """
     #Exercise 2B
@@ -0,0 +1,531 @@
+import os
+import struct
+import zlib
+
+import numpy as np
+
+
+class DensityGrid:
+    """
+    ==============================================
+    Class DensityGrid binning points into a fixed
+    size 2D histogram, so the cost of an image depends
+    on its resolution and not on the number of points.
+    ==============================================
+    """
+    def __init__(self, extent, width, height=None, filename=None,
+                 dtype=np.float64):
+        """
+        Constructs all necessary attributes for the grid object
+        Arguments:
+        ----------
+            extent (tuple): (xmin, xmax, ymin, ymax) covered by the grid
+            width (int): number of pixels along x
+            height (int): number of pixels along y, if None it is
+            chosen so the pixels are square
+            filename (string): if given, the counts live in a memory
+            mapped .npy file on disk instead of in RAM
+            dtype (dtype): type of the counts, e.g. np.float32 or
+            np.uint32 to halve the size of a poster grid
+        """
+        xmin, xmax, ymin, ymax = (float(v) for v in extent)
+        if not (xmax > xmin and ymax > ymin):
+            raise ValueError("Extent needs xmax > xmin and ymax > ymin!")
+        if height is None:
+            height = max(1, int(round(width * (ymax - ymin) / (xmax - xmin))))
+        if not (isinstance(width, int) and isinstance(height, int)
+                and width > 0 and height > 0):
+            raise ValueError("Width and height need to be positive ints!")
+
+        self.extent = (xmin, xmax, ymin, ymax)
+        self.width = width
+        self.height = height
+        self.filename = filename
+        if filename is None:
+            self.counts = np.zeros((height, width), dtype=dtype)
+        else:
+            self.counts = np.lib.format.open_memmap(
+                filename, mode="w+", dtype=dtype, shape=(height, width))
+        self.values = None
+        self.total = 0
+
+    def _pixels(self, points):
+        """
+        Private method mapping points to flat pixel indices. Row 0 is
+        the top of the image, that is ymax.
+
+        Arguments:
+        ----------
+            points (ndarray): Array of shape (N, 2)
+        Returns:
+        --------
+            [ndarray]: Flat indices of the points inside the extent
+            [ndarray]: Boolean mask of the points inside the extent
+        """
+        xmin, xmax, ymin, ymax = self.extent
+        x = points[:, 0]
+        y = points[:, 1]
+        inside = (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
+        x = x[inside]
+        y = y[inside]
+
+        ix = ((x - xmin) * (self.width / (xmax - xmin))).astype(np.intp)
+        iy = ((ymax - y) * (self.height / (ymax - ymin))).astype(np.intp)
+        np.minimum(ix, self.width - 1, out=ix)
+        np.minimum(iy, self.height - 1, out=iy)
+        return iy * self.width + ix, inside
+
+    def add(self, points, values=None, weights=None):
+        """
+        Method adding a chunk of points to the grid. Points outside the
+        extent are dropped.
+
+        Arguments:
+        ----------
+            points (ndarray): Array of shape (N, 2)
+            values (ndarray): Optional value per point, e.g. a color
+            index. The grid keeps the sum per pixel, so the mean value
+            can be looked up later.
+            weights (ndarray): Optional weight per point, added to the
+            counts and the total instead of 1. The values are weighted
+            the same way. Needs floating point counts.
+        Returns:
+        --------
+            None, only updates counts (and values)
+        """
+        points = np.asarray(points, dtype=float)
+        flat, inside = self._pixels(points)
+        size = self.width * self.height
+        if weights is not None:
+            if not np.issubdtype(self.counts.dtype, np.floating):
+                raise TypeError("Weights need a grid with floating point counts!")
+            weights = np.asarray(weights, dtype=float)[inside]
+            self.total += weights.sum()
+        else:
+            self.total += len(flat)
+        if values is not None:
+            if self.values is None:
+                self.values = self._zeros("values")
+            values = np.asarray(values, dtype=float)[inside]
+            if weights is not None:
+                values = values * weights
+
+        if size <= 4 * len(flat):
+            counts = np.bincount(flat, weights=weights, minlength=size)
+            self.counts += counts.reshape(self.counts.shape).astype(self.counts.dtype)
+            if values is not None:
+                sums = np.bincount(flat, weights=values, minlength=size)
+                self.values += sums.reshape(self.counts.shape)
+            return
+
+        # Large grid compared to the chunk: only touch the hit pixels.
+        pixels, inverse, counts = np.unique(flat, return_inverse=True,
+                                            return_counts=True)
+        if weights is not None:
+            counts = np.bincount(inverse, weights=weights, minlength=len(pixels))
+        self.counts.reshape(-1)[pixels] += counts.astype(self.counts.dtype)
+        if values is not None:
+            sums = np.bincount(inverse, weights=values, minlength=len(pixels))
+            self.values.reshape(-1)[pixels] += sums
+
+    def _zeros(self, name):
+        """
+        Private method making a float64 array with the shape of the
+        counts, memory mapped next to the counts file if there is one.
+
+        Arguments:
+        ----------
+            name (string): suffix of the file name
+        Returns:
+        --------
+            [ndarray]: Array of zeros
+        """
+        if self.filename is None:
+            return np.zeros(self.counts.shape)
+        root, ext = os.path.splitext(self.filename)
+        return np.lib.format.open_memmap(f"{root}_{name}.npy", mode="w+",
+                                         dtype=np.float64,
+                                         shape=self.counts.shape)
+
+    def tiles(self, tile=2048):
+        """
+        Generator splitting the grid into square tiles.
+
+        Arguments:
+        ----------
+            tile (int): side length of the tiles in pixels
+
+        Yields:
+        --------
+            [tuple]: (rows, cols) slices of one tile
+        """
+        for i in range(0, self.height, tile):
+            for j in range(0, self.width, tile):
+                yield slice(i, i + tile), slice(j, j + tile)
+
+    def _top(self, log, tile=2048):
+        """
+        Private method finding the largest tone mapped count, one tile
+        at a time.
+
+        Arguments:
+        ----------
+            log (boolean expression): log scale of the counts
+            tile (int): side length of the tiles in pixels
+        Returns:
+        --------
+            [float]: largest value, used to normalize the image
+        """
+        top = max(float(self.counts[rows, cols].max())
+                  for rows, cols in self.tiles(tile))
+        return float(np.log1p(top)) if log else top
+
+    @staticmethod
+    def _tone(counts, top, gamma, log):
+        """
+        Private method tone mapping a block of counts to [0, 1].
+
+        Arguments:
+        ----------
+            counts (ndarray): block of counts
+            top (float): value mapped to 1
+            gamma (float): gamma correction
+            log (boolean expression): log scale of the counts
+        Returns:
+        --------
+            [ndarray]: tone mapped block
+        """
+        d = np.log1p(counts, dtype=float) if log else np.array(counts, dtype=float)
+        if top > 0:
+            d /= top
+        return d ** (1 / gamma)
+
+    def write_tiles(self, filename, gamma=2.2, log=True, tile=2048):
+        """
+        Method tone mapping the grid tile by tile into an 8-bit image
+        stored as a memory mapped .npy file. Only one tile is held in
+        RAM at a time, whatever the size of the grid.
+
+        Arguments:
+        ----------
+            filename (string): path of the .npy image
+            gamma (float): gamma correction
+            log (boolean expression): log scale of the counts
+            tile (int): side length of the tiles in pixels
+        Returns:
+        --------
+            [memmap]: the image of shape (height, width), dtype uint8
+        """
+        top = self._top(log, tile)
+        image = np.lib.format.open_memmap(filename, mode="w+", dtype=np.uint8,
+                                          shape=self.counts.shape)
+        for rows, cols in self.tiles(tile):
+            d = self._tone(self.counts[rows, cols], top, gamma, log)
+            image[rows, cols] = np.round(255 * d)
+        image.flush()
+        return image
+
+    def merge(self, other):
+        """
+        Method adding the counts and values of another grid covering
+        the same extent with the same number of pixels.
+
+        Arguments:
+        ----------
+            other (DensityGrid): grid to add
+        Returns:
+        --------
+            None, only updates counts (and values)
+        """
+        if other.extent != self.extent or other.counts.shape != self.counts.shape:
+            raise ValueError("Can only merge grids with the same extent and size!")
+        self.total += other.total
+        if other.values is not None and self.values is None:
+            self.values = self._zeros("values")
+        for rows, cols in self.tiles():
+            self.counts[rows, cols] += other.counts[rows, cols]
+            if other.values is not None:
+                self.values[rows, cols] += other.values[rows, cols]
+
+    def downsample(self, factor):
+        """
+        Method summing blocks of factor x factor pixels, e.g. to reduce
+        a supersampled grid to the final image size. Rows and columns
+        that do not fill a whole block are dropped.
+
+        Arguments:
+        ----------
+            factor (int): number of pixels per side in a block
+        Returns:
+        --------
+            [DensityGrid]: new grid of the reduced size
+        """
+        h = self.height // factor
+        w = self.width // factor
+        xmin, xmax, ymin, ymax = self.extent
+        extent = (xmin, xmin + (xmax - xmin) * w * factor / self.width,
+                  ymax - (ymax - ymin) * h * factor / self.height, ymax)
+        grid = DensityGrid(extent, w, h)
+
+        def reduce(a):
+            return a[:h * factor, :w * factor].reshape(h, factor, w, factor).sum(axis=(1, 3))
+
+        grid.counts += reduce(self.counts)
+        if self.values is not None:
+            grid.values = reduce(self.values)
+        grid.total = self.total
+        return grid
+
+    def image(self, gamma=2.2, log=True):
+        """
+        Method tone mapping the counts to an image with values in [0, 1].
+
+        Arguments:
+        ----------
+            gamma (float): gamma correction, 1 leaves the scale unchanged
+            log (boolean expression): True compresses the counts with
+            log(1 + counts) before scaling
+        Returns:
+        --------
+            [ndarray]: Array of shape (height, width)
+        """
+        return self._tone(self.counts, self._top(log), gamma, log)
+
+    def mean_values(self):
+        """
+        Method computing the mean value stored in every pixel, 0 where
+        no points landed.
+
+        Returns:
+        --------
+            [ndarray]: Array of shape (height, width)
+        """
+        if self.values is None:
+            raise ValueError("No values added to the grid!")
+        mean = np.zeros(self.counts.shape)
+        np.divide(self.values, self.counts, out=mean, where=self.counts > 0)
+        return mean
+
+    def to_rgba(self, cmap="jet", gamma=2.2, log=True, vmin=None, vmax=None):
+        """
+        Method giving a colored image, where the color is the mean value
+        of every pixel through a colormap and the alpha is the tone
+        mapped density.
+
+        Arguments:
+        ----------
+            cmap (colormap): Certain set of colors, or its name.
+            gamma (float): gamma correction of the density
+            log (boolean expression): log scale of the density
+            vmin, vmax (float): range of the values, defaults to
+            the smallest and largest mean value
+        Returns:
+        --------
+            [ndarray]: Array of shape (height, width, 4) in [0, 1]
+        """
+        cmap, lo, hi = self._color_range(cmap, vmin, vmax)
+        return self._rgba(slice(None), cmap, self._top(log), lo, hi, gamma, log)
+
+    def _color_range(self, cmap, vmin, vmax, tile=2048):
+        """
+        Private method looking up the colormap and the range of the
+        mean values, one tile at a time.
+
+        Arguments:
+        ----------
+            cmap (colormap): Certain set of colors, or its name.
+            vmin, vmax (float): range of the values, None to use the
+            smallest and largest mean value
+            tile (int): side length of the tiles in pixels
+        Returns:
+        --------
+            [colormap]: the colormap
+            [float]: value mapped to the first color
+            [float]: value mapped to the last color
+        """
+        from matplotlib import colormaps
+
+        if isinstance(cmap, str):
+            cmap = colormaps[cmap]
+        lo, hi = np.inf, -np.inf
+        if self.values is not None and (vmin is None or vmax is None):
+            for rows, cols in self.tiles(tile):
+                hit = self.counts[rows, cols] > 0
+                if hit.any():
+                    mean = self.values[rows, cols][hit] / self.counts[rows, cols][hit]
+                    lo = min(lo, mean.min())
+                    hi = max(hi, mean.max())
+        lo = vmin if vmin is not None else (lo if np.isfinite(lo) else 0)
+        hi = vmax if vmax is not None else (hi if np.isfinite(hi) else 1)
+        return cmap, lo, hi
+
+    def _rgba(self, rows, cmap, top, lo, hi, gamma, log):
+        """
+        Private method giving the colored image of a block of rows.
+
+        Arguments:
+        ----------
+            rows (slice): rows of the block
+            cmap (colormap): the colormap
+            top (float): tone mapped count mapped to full alpha
+            lo, hi (float): range of the values
+            gamma (float): gamma correction of the density
+            log (boolean expression): log scale of the density
+        Returns:
+        --------
+            [ndarray]: Array of shape (rows, width, 4) in [0, 1]
+        """
+        counts = self.counts[rows]
+        alpha = self._tone(counts, top, gamma, log)
+        if self.values is None:
+            rgba = np.zeros(alpha.shape + (4,))
+        else:
+            mean = np.zeros(counts.shape)
+            np.divide(self.values[rows], counts, out=mean, where=counts > 0)
+            scaled = (mean - lo) / (hi - lo) if hi > lo else np.zeros_like(mean)
+            rgba = cmap(np.clip(scaled, 0, 1))
+        rgba[..., 3] = alpha
+        return rgba
+
+    def blocks(self, color=False, cmap="jet", gamma=2.2, log=True, rows=None):
+        """
+        Generator tone mapping the grid a block of rows at a time, so
+        only one block of the image is held in RAM, whatever the size
+        of the grid.
+
+        Arguments:
+        ----------
+            color (boolean expression): True gives the colored RGBA
+            image, False the gray image
+            cmap (colormap): Certain set of colors.
+            gamma (float): gamma correction
+            log (boolean expression): log scale of the counts
+            rows (int): number of rows per block, by default about
+            2**20 pixels per block
+        Yields:
+        --------
+            [ndarray]: blocks of shape (rows, width) or (rows, width, 4)
+            in [0, 1]
+        """
+        if rows is None:
+            rows = max(1, 2**20 // self.width)
+        top = self._top(log)
+        if color:
+            cmap, lo, hi = self._color_range(cmap, None, None)
+        for i in range(0, self.height, rows):
+            if color:
+                yield self._rgba(slice(i, i + rows), cmap, top, lo, hi, gamma, log)
+            else:
+                yield self._tone(self.counts[i:i + rows], top, gamma, log)
+
+    def save(self, filename, color=False, cmap="jet", gamma=2.2, log=True):
+        """
+        Method writing the grid straight to a file, without a matplotlib
+        figure. A .png gets the tone mapped image, a .npy the raw counts
+        for other tools. The image is tone mapped and compressed a block
+        of rows at a time, see blocks(), so no full size image is made.
+
+        Arguments:
+        ----------
+            filename (string): path ending in .png or .npy
+            color (boolean expression): True writes the colored RGBA image
+            cmap (colormap): Certain set of colors.
+            gamma (float): gamma correction
+            log (boolean expression): log scale of the counts
+        Returns:
+        --------
+            None, only writes the file
+        """
+        ext = os.path.splitext(filename)[1].lower()
+        if ext == ".npy":
+            np.save(filename, self.counts)
+        elif ext == ".png":
+            shape = (self.height, self.width, 4) if color else (self.height, self.width)
+            write_png(filename, self.blocks(color, cmap, gamma, log), shape=shape)
+        else:
+            raise TypeError("Can only save to .png or .npy!")
+
+
+def estimate_extent(points, cut=0.5, pad=0.05):
+    """
+    Function estimating a window holding almost all of a point cloud,
+    e.g. a short run of a game, so a DensityGrid can be sized before
+    the real run. Points that are not finite are ignored.
+
+    Arguments:
+    ----------
+        points (ndarray): Array of shape (N, 2)
+        cut (float): percent of outliers cut on every side
+        pad (float): margin added on every side, as a fraction of the
+        size of the window
+
+    Returns:
+    --------
+        [tuple]: (xmin, xmax, ymin, ymax)
+    """
+    points = np.asarray(points, dtype=float)
+    points = points[np.all(np.isfinite(points), axis=1)]
+    if len(points) == 0:
+        raise ValueError("Needs finite points to estimate an extent!")
+    low = np.percentile(points, cut, axis=0)
+    high = np.percentile(points, 100 - cut, axis=0)
+    margin = pad * (high - low) + 1e-9
+    return (low[0] - margin[0], high[0] + margin[0], low[1] - margin[1], high[1] + margin[1])
+
+
+def write_png(filename, image, rows=256, shape=None):
+    """
+    Function writing an image as a PNG file with zlib, a block of rows
+    at a time, so a memory mapped image never has to fit in RAM.
+
+    Arguments:
+    ----------
+        filename (string): path of the PNG file
+        image (ndarray or iterable): (height, width) gray or
+        (height, width, 3 or 4) RGB(A) image, either uint8 or floats in
+        [0, 1], or blocks of rows of such an image, e.g. from
+        DensityGrid.blocks()
+        rows (int): number of rows compressed per block of an array
+        shape (tuple): shape of the whole image, needed for blocks
+
+    Returns:
+    --------
+        None, only writes the file
+    """
+    if isinstance(image, np.ndarray):
+        shape = image.shape
+        blocks = (image[i:i + rows] for i in range(0, shape[0], rows))
+    elif shape is None:
+        raise ValueError("Blocks of rows need the shape of the image!")
+    else:
+        blocks = image
+    if len(shape) == 2:
+        color_type = 0
+    elif len(shape) == 3 and shape[2] in (3, 4):
+        color_type = 2 if shape[2] == 3 else 6
+    else:
+        raise ValueError("Image needs shape (h, w), (h, w, 3) or (h, w, 4)!")
+    height, width = shape[:2]
+
+    def chunk(out, tag, data):
+        out.write(struct.pack(">I", len(data)))
+        out.write(tag + data)
+        out.write(struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF))
+
+    compressor = zlib.compressobj(6)
+    with open(filename, "wb") as out:
+        out.write(b"\x89PNG\r\n\x1a\n")
+        chunk(out, b"IHDR", struct.pack(">IIBBBBB", width, height, 8,
+                                        color_type, 0, 0, 0))
+        for block in blocks:
+            if block.dtype != np.uint8:
+                block = np.round(255 * np.clip(block, 0, 1)).astype(np.uint8)
+            block = block.reshape(len(block), -1)
+            # Every row starts with filter type 0, no filtering.
+            lines = np.zeros((len(block), block.shape[1] + 1), dtype=np.uint8)
+            lines[:, 1:] = block
+            data = compressor.compress(lines.tobytes())
+            if data:
+                chunk(out, b"IDAT", data)
+        chunk(out, b"IDAT", compressor.flush())
+        chunk(out, b"IEND", b"")
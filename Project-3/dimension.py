@@ -0,0 +1,143 @@
+import numpy as np
+
+
+class BoxCounter:
+    """
+    ==============================================
+    Class BoxCounter estimating the box-counting
+    dimension of a point cloud, fed one chunk at a time.
+    ==============================================
+    """
+    def __init__(self, extent, levels=10):
+        """
+        Constructs all necessary attributes for the counter object
+        Arguments:
+        ----------
+            extent (tuple): (xmin, xmax, ymin, ymax) holding every point,
+            widened to a square so all boxes are squares
+            levels (int): the finest grid has 2**levels boxes per side,
+            at most 31
+        """
+        if not (isinstance(levels, int) and 1 <= levels <= 31):
+            raise ValueError("Levels needs to be an int between 1 and 31!")
+        xmin, xmax, ymin, ymax = (float(v) for v in extent)
+        side = max(xmax - xmin, ymax - ymin)
+        if not side > 0:
+            raise ValueError("Extent needs a positive size!")
+
+        self.origin = np.array([xmin, ymin])
+        self.side = side
+        self.levels = levels
+        self.occupied = np.zeros(0, dtype=np.int64)
+        self.total = 0
+        self._pending = []
+        self._pending_size = 0
+
+    def add(self, points):
+        """
+        Method quantizing a chunk of points to integer boxes on the
+        finest grid. Only the occupied boxes are kept, as sorted unique
+        keys ix * 2**levels + iy. New keys are merged with the boxes
+        already seen once they add up to as many, so the sorting cost
+        stays proportional to the number of occupied boxes.
+
+        Arguments:
+        ----------
+            points (ndarray): Array of shape (N, 2)
+        Returns:
+        --------
+            None, only updates the occupied boxes
+        """
+        points = np.asarray(points, dtype=float)
+        cells = 2**self.levels
+        ij = np.floor((points - self.origin) * (cells / self.side)).astype(np.int64)
+        inside = np.all((ij >= 0) & (ij < cells), axis=1)
+        ij = ij[inside]
+        keys = np.unique((ij[:, 0] << self.levels) | ij[:, 1])
+        self._pending.append(keys)
+        self._pending_size += len(keys)
+        self.total += len(ij)
+        if self._pending_size > max(len(self.occupied), 2**20):
+            self._merge()
+
+    def _merge(self):
+        """
+        Private method merging the pending keys into the occupied boxes.
+
+        Returns:
+        --------
+            None, only updates the occupied boxes
+        """
+        if self._pending:
+            self.occupied = np.unique(np.concatenate([self.occupied] + self._pending))
+            self._pending = []
+            self._pending_size = 0
+
+    def counts(self):
+        """
+        Method counting the occupied boxes on every grid, from the
+        finest one by dropping the lowest bits of the box coordinates.
+
+        Returns:
+        --------
+            [ndarray]: box sizes, from largest to smallest
+            [ndarray]: number of occupied boxes of every size
+        """
+        self._merge()
+        L = self.levels
+        ix = self.occupied >> L
+        iy = self.occupied & ((1 << L) - 1)
+        sizes = np.zeros(L + 1)
+        counts = np.zeros(L + 1, dtype=np.int64)
+        for level in range(L + 1):
+            shift = L - level
+            keys = ((ix >> shift) << level) | (iy >> shift)
+            sizes[level] = self.side / 2**level
+            counts[level] = len(np.unique(keys))
+        return sizes, counts
+
+    def dimension(self, fit=None):
+        """
+        Method fitting the slope of log(count) against log(1/size).
+
+        Arguments:
+        ----------
+            fit (tuple): (first, last) levels used in the fit, defaults
+            to the levels from 3 up to the finest one
+        Returns:
+        --------
+            [float]: estimated box-counting dimension
+        """
+        sizes, counts = self.counts()
+        first, last = fit if fit is not None else (min(3, self.levels - 1), self.levels)
+        sl = slice(first, last + 1)
+        slope = np.polyfit(np.log(1 / sizes[sl]), np.log(counts[sl]), 1)[0]
+        return slope
+
+
+def box_dimension(points, extent, levels=10, fit=None):
+    """
+    Function estimating the box-counting dimension of a point cloud in
+    one pass.
+
+    Arguments:
+    ----------
+        points (ndarray or iterable): Array of shape (N, 2), or chunks
+        of points, e.g. ChaosGame.chunks(), whose tuples start with
+        the points
+        extent (tuple): (xmin, xmax, ymin, ymax) holding every point
+        levels (int): the finest grid has 2**levels boxes per side
+        fit (tuple): levels used in the fit, see BoxCounter.dimension
+
+    Returns:
+    --------
+        [float]: estimated box-counting dimension
+    """
+    counter = BoxCounter(extent, levels)
+    if isinstance(points, np.ndarray):
+        points = [points]
+    for chunk in points:
+        if isinstance(chunk, tuple):
+            chunk = chunk[0]
+        counter.add(chunk)
+    return counter.dimension(fit)
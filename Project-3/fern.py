@@ -1,6 +1,16 @@
+import json
+import os
+
 import matplotlib.pyplot as plt
 import numpy as np
 
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+
+from density import DensityGrid, estimate_extent
+
 
 class Affinetransform:
     """
@@ -46,6 +56,20 @@ class Affinetransform:
         self.pass_point = point
         return point
 
+    @property
+    def matrix(self):
+        """
+        The linear part [[a, b], [c, d]] as an ndarray.
+        """
+        return np.array([[self.a, self.b], [self.c, self.d]], dtype=float)
+
+    @property
+    def offset(self):
+        """
+        The translation [e, f] as an ndarray.
+        """
+        return np.array([self.e, self.f], dtype=float)
+
 
 def choose(p_values, functions):
     """
@@ -66,7 +90,7 @@ def choose(p_values, functions):
         if r < p:
             return functions[j]
 
-def iterate(steps, discard, functions):
+def iterate(steps, discard, functions, p_values):
     """
     Method iterating several times our choose method to
     obtain values.
@@ -75,38 +99,736 @@ def iterate(steps, discard, functions):
         steps (int): Number of iterations
         functions (int): List with differnt kind of
         functions
+        p_values (ndarray): probability of every function
 
     Returns:
     --------
         [ndarray]: Many positional values due to
         probability.
     """
-    X = [[0, 0]]
-    X_prev = [0, 0]
+    return IFS.from_functions(functions, p_values).iterate(steps, discard)
+
+
+def load_ifs(filename):
+    """
+    Function reading an IFS definition from a JSON or TOML file, e.g.
+
+        {"name": "barnsley_fern",
+         "maps": [{"coeffs": [0, 0, 0, 0.16, 0, 0], "probability": 0.01,
+                   "color": 0.0}, ...]}
+
+    with coeffs (a, b, c, d, e, f) of x' = a*x + b*y + e,
+    y' = c*x + d*y + f. The color of a map is optional, but then needed
+    for every map. With "probabilities": "determinant" (and optionally
+    "floor") the maps need no probability, see
+    IFS.determinant_p_values().
+
+    Arguments:
+    ----------
+        filename (string): path ending in .json or .toml
+
+    Returns:
+    --------
+        [IFS]: the compiled system
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == ".json":
+        with open(filename) as infile:
+            definition = json.load(infile)
+    elif ext == ".toml":
+        if tomllib is None:
+            raise ImportError("Reading TOML needs Python 3.11 or newer!")
+        with open(filename, "rb") as infile:
+            definition = tomllib.load(infile)
+    else:
+        raise TypeError("Needs a .json or .toml file!")
+    return IFS.from_dict(definition)
+
+
+class IFS:
+    """
+    ==============================================
+    Class IFS storing all affine maps of an iterated
+    function system as stacked arrays, so whole runs
+    of the random walk are computed with NumPy.
+    ==============================================
+    """
+    def __init__(self, matrices, offsets, p_values, colors=None, name=None):
+        """
+        Constructs all necessary attributes for the IFS object
+        Arguments:
+        ----------
+            matrices (ndarray): linear parts, shape (k, 2, 2)
+            offsets (ndarray): translations, shape (k, 2)
+            p_values (ndarray): probability of every map, summing to 1
+            colors (ndarray): optional color index in [0, 1] of every map
+            name (string): optional name of the fractal
+        """
+        matrices = np.asarray(matrices, dtype=float)
+        offsets = np.asarray(offsets, dtype=float)
+        p_values = np.asarray(p_values, dtype=float)
+        k = len(matrices)
+        if matrices.shape != (k, 2, 2) or offsets.shape != (k, 2) or k == 0:
+            raise ValueError("Needs matrices of shape (k, 2, 2) and offsets of shape (k, 2)!")
+        if p_values.shape != (k,) or np.any(p_values < 0) or abs(p_values.sum() - 1) > 1e-9:
+            raise ValueError("Needs one probability per map, summing to 1!")
+        if colors is not None:
+            colors = np.asarray(colors, dtype=float)
+            if colors.shape != (k,) or np.any(colors < 0) or np.any(colors > 1):
+                raise ValueError("Needs one color between 0 and 1 per map!")
+        if not (np.all(np.isfinite(matrices)) and np.all(np.isfinite(offsets))):
+            raise ValueError("Coefficients need to be finite!")
+
+        self.matrices = matrices
+        self.offsets = offsets
+        self.p_values = p_values
+        self.colors = colors
+        self.name = name
+        # Coefficients a, b, c, d, e, f of all maps as contiguous rows of
+        # shape (6, k), for the elementwise updates of the engines.
+        self._columns = np.ascontiguousarray(np.column_stack((matrices.reshape(k, 4), offsets)).T)
+        self._cumulative = np.cumsum(p_values)
+        self._cumulative[-1] = 1.0
+        self.grid = None
+
+    @classmethod
+    def from_functions(cls, functions, p_values):
+        """
+        Method building the IFS from lists [a, b, c, d, e, f], like
+        the ones passed to iterate().
+
+        Arguments:
+        ----------
+            functions (list): coefficients of every map
+            p_values (list): probability of every map
+
+        Returns:
+        --------
+            [IFS]: the new system
+        """
+        coeffs = np.asarray(functions, dtype=float).reshape(-1, 6)
+        return cls(coeffs[:, :4].reshape(-1, 2, 2), coeffs[:, 4:], p_values)
+
+    @classmethod
+    def from_dict(cls, definition):
+        """
+        Method building the IFS from a parsed definition, see load_ifs().
+
+        Arguments:
+        ----------
+            definition (dict): "maps" and optionally "name",
+            "probabilities" and "floor"
+
+        Returns:
+        --------
+            [IFS]: the new system
+        """
+        maps = definition.get("maps") if isinstance(definition, dict) else None
+        if not isinstance(maps, list) or len(maps) == 0:
+            raise ValueError("Definition needs a non-empty list of maps!")
+        weighting = definition.get("probabilities", "given")
+        if weighting not in ("given", "determinant"):
+            raise ValueError("Probabilities need to be 'given' or 'determinant'!")
+        coeffs = []
+        p_values = []
+        colors = []
+        for i, m in enumerate(maps):
+            if not isinstance(m, dict) or "coeffs" not in m:
+                raise ValueError(f"Map {i} needs coeffs!")
+            if weighting == "given" and "probability" not in m:
+                raise ValueError(f"Map {i} needs a probability!")
+            if len(m["coeffs"]) != 6:
+                raise ValueError(f"Map {i} needs six affine coefficients a, b, c, d, e, f!")
+            coeffs.append(m["coeffs"])
+            p_values.append(m.get("probability", 0))
+            colors.append(m.get("color"))
+        if all(c is None for c in colors):
+            colors = None
+        elif any(c is None for c in colors):
+            raise ValueError("Either every map or no map needs a color!")
+        try:
+            coeffs = np.array(coeffs, dtype=float)
+            p_values = np.array(p_values, dtype=float)
+        except (TypeError, ValueError):
+            raise ValueError("Coefficients and probabilities need to be numbers!")
+        matrices = coeffs[:, :4].reshape(-1, 2, 2)
+        if weighting == "determinant":
+            p_values = cls.determinant_p_values(matrices, definition.get("floor", 0.01))
+        return cls(matrices, coeffs[:, 4:], p_values,
+                   colors=colors, name=definition.get("name"))
+
+    @staticmethod
+    def determinant_p_values(matrices, floor=0.01):
+        """
+        Method giving every map a probability proportional to how much
+        area it keeps, |det A|, so small pieces of the attractor get
+        few points and large ones many. Maps squashing the plane onto
+        a line, like the stem of the fern, have det A = 0 and get floor
+        instead, before normalizing.
+
+        Arguments:
+        ----------
+            matrices (ndarray): linear parts, shape (k, 2, 2)
+            floor (float): smallest weight of a map, > 0
+
+        Returns:
+        --------
+            [ndarray]: probabilities of shape (k,), summing to 1
+        """
+        if not floor > 0:
+            raise ValueError("Floor needs to be positive!")
+        weights = np.maximum(np.abs(np.linalg.det(np.asarray(matrices, dtype=float))), floor)
+        return weights / weights.sum()
+
+    def with_determinant_p_values(self, floor=0.01):
+        """
+        Method giving the same maps with determinant weighted
+        probabilities, see determinant_p_values().
+
+        Arguments:
+        ----------
+            floor (float): smallest weight of a map
+
+        Returns:
+        --------
+            [IFS]: the new system
+        """
+        return IFS(self.matrices, self.offsets, self.determinant_p_values(self.matrices, floor),
+                   colors=self.colors, name=self.name)
+
+    @classmethod
+    def from_transforms(cls, transforms, p_values):
+        """
+        Method building the IFS from Affinetransform objects.
+
+        Arguments:
+        ----------
+            transforms (list): Affinetransform of every map
+            p_values (list): probability of every map
+
+        Returns:
+        --------
+            [IFS]: the new system
+        """
+        return cls([F.matrix for F in transforms], [F.offset for F in transforms], p_values)
+
+    def choose(self, size, rng=None):
+        """
+        Method drawing many map indices at once, by looking uniform
+        numbers up in the cumulative probabilities.
+
+        Arguments:
+        ----------
+            size (int): number of indices
+            rng (Generator): random stream, the global NumPy state
+            is used if None
+
+        Returns:
+        --------
+            [ndarray]: Array of ints in 0 <= j < k
+        """
+        u = (np.random if rng is None else rng).random(size)
+        if len(self.p_values) > 8:
+            idx = np.searchsorted(self._cumulative, u, side="right")
+            return np.minimum(idx, len(self.p_values) - 1)
+        # For a few maps, counting the thresholds below u is faster.
+        idx = np.zeros(size, dtype=np.intp)
+        for p in self._cumulative[:-1]:
+            idx += u >= p
+        return idx
+
+    def _orbit(self, x0, idx, segment=64):
+        """
+        Private method applying the maps idx[0], idx[1], ... one after
+        another to x0 and returning every point on the way. The indices
+        are cut into segments of the given length, and the running
+        compositions of all segments are built together, one position
+        at a time. The start of every segment then follows from the
+        composition of the segments before it, so the Python loops run
+        over about sqrt(len(idx)) steps instead of every point.
+
+        Arguments:
+        ----------
+            x0 (ndarray): starting point
+            idx (ndarray): indices of the maps
+            segment (int): number of maps per segment
+
+        Returns:
+        --------
+            [ndarray]: Array of shape (len(idx), 2)
+        """
+        n = len(idx)
+        S = -(-n // segment)
+        padded = np.zeros(S * segment, dtype=np.intp)
+        padded[:n] = idx
+        # Coefficients laid out as (6, segment, S), row t holds map t of every segment.
+        a, b, c, d, e, f = np.take(self._columns, padded.reshape(S, segment).T, axis=1)
+        for t in range(1, segment):
+            # Row t becomes M_t o (M_{t-1} o ... o M_0).
+            a0, b0, c0, d0, e0, f0 = a[t - 1], b[t - 1], c[t - 1], d[t - 1], e[t - 1], f[t - 1]
+            a1, b1, c1, d1 = a[t].copy(), b[t].copy(), c[t].copy(), d[t].copy()
+            e[t] += a1 * e0 + b1 * f0
+            f[t] += c1 * e0 + d1 * f0
+            a[t] = a1 * a0 + b1 * c0
+            b[t] = a1 * b0 + b1 * d0
+            c[t] = c1 * a0 + d1 * c0
+            d[t] = c1 * b0 + d1 * d0
+
+        starts = np.zeros((2, S))
+        x, y = x0
+        ta, tb, tc, td, te, tf = (v[-1].tolist() for v in (a, b, c, d, e, f))
+        for s in range(S):
+            starts[0, s] = x
+            starts[1, s] = y
+            x, y = ta[s] * x + tb[s] * y + te[s], tc[s] * x + td[s] * y + tf[s]
+
+        X = np.empty((S * segment, 2))
+        X[:, 0] = (a * starts[0] + b * starts[1] + e).T.ravel()
+        X[:, 1] = (c * starts[0] + d * starts[1] + f).T.ravel()
+        return X[:n]
+
+    def chunks(self, steps, discard=5, x0=(0, 0), chunk=2**16, rng=None):
+        """
+        Generator yielding the orbit in chunks, starting at x0 like
+        iterate(), so long runs need constant memory.
+
+        Arguments:
+        ----------
+            steps (int): number of points to yield
+            discard (int): number of ignored points at start
+            x0 (tuple): starting point
+            chunk (int): largest number of points per chunk
+            rng (Generator): random stream, the global NumPy state
+            is used if None
+
+        Yields:
+        --------
+            [ndarray]: points of shape (m, 2)
+        """
+        x = np.array(x0, dtype=float)
+        if discard == 0 and steps > 0:
+            yield x[np.newaxis].copy()
+            steps -= 1
+        skip = max(0, discard - 1)
+        while skip > 0:
+            size = min(chunk, skip)
+            x = self._orbit(x, self.choose(size, rng))[-1]
+            skip -= size
+        while steps > 0:
+            size = min(chunk, steps)
+            points = self._orbit(x, self.choose(size, rng))
+            x = points[-1]
+            steps -= size
+            yield points
+
+    def iterate(self, steps, discard=5, x0=(0, 0), chunk=2**16, rng=None):
+        """
+        Method computing the random orbit, the same points as applying
+        the chosen Affinetransform one step at a time in a loop, for the
+        same random numbers.
+
+        Arguments:
+        ----------
+            steps (int): number of points kept
+            discard (int): number of ignored points at start
+            x0 (tuple): starting point
+            chunk (int): number of points computed per vectorized pass
+            rng (Generator): random stream, the global NumPy state
+            is used if None
+
+        Returns:
+        --------
+            [ndarray]: Array of shape (steps, 2)
+        """
+        X = np.zeros((steps, 2))
+        start = 0
+        for points in self.chunks(steps, discard, x0, chunk, rng):
+            X[start:start + len(points)] = points
+            start += len(points)
+        return X
+
+    def fixed_point(self, j):
+        """
+        Method giving the fixed point of map j, x = A x + t. It lies on
+        the attractor, so walkers started there need no burn-in to
+        reach it.
+
+        Arguments:
+        ----------
+            j (int): index of the map
+
+        Returns:
+        --------
+            [ndarray]: the fixed point, shape (2,)
+        """
+        return np.linalg.solve(np.eye(2) - self.matrices[j], self.offsets[j])
+
+    def walk(self, samples, walkers=2**16, discard=20, rng=None):
+        """
+        Generator running many walkers in lockstep. At every step each
+        walker picks its own map and all walkers move with one batched
+        update, so the work per step is a few wide NumPy operations.
+        The walkers start on the fixed point of the most likely map and
+        are spread over the attractor by the first discard steps. With
+        colors, every walker also carries the gradient color
+        (c + color of the map) / 2.
+
+        Arguments:
+        ----------
+            samples (int): number of points to yield in total
+            walkers (int): number of walkers
+            discard (int): number of steps before points are yielded
+            rng (Generator): random stream, the global NumPy state
+            is used if None
+
+        Yields:
+        --------
+            [tuple]: (X, colors), the walker positions after every step,
+            shape (m, 2) with m <= walkers, and their colors, None
+            without colors
+        """
+        a, b, c, d, e, f = self._columns
+        x0, y0 = self.fixed_point(int(np.argmax(self.p_values)))
+        x = np.full(walkers, x0)
+        y = np.full(walkers, y0)
+        colors = None if self.colors is None else np.full(walkers, 0.5)
+
+        step = 0
+        while samples > 0:
+            idx = self.choose(walkers, rng)
+            x, y = (a[idx] * x + b[idx] * y + e[idx],
+                    c[idx] * x + d[idx] * y + f[idx])
+            if colors is not None:
+                colors = (colors + self.colors[idx]) / 2
+            step += 1
+            if step > discard:
+                size = min(walkers, samples)
+                yield (np.column_stack((x[:size], y[:size])),
+                       None if colors is None else colors[:size])
+                samples -= size
+
+    def render(self, samples, width=500, extent=None, walkers=2**16,
+               discard=20, rng=None, filename=None):
+        """
+        Method rendering the attractor into a DensityGrid with the
+        walkers of walk(), one step of all walkers per chunk. With
+        colors, the grid also keeps the mean color of every pixel.
+
+        Arguments:
+        ----------
+            samples (int): number of points
+            width (int): width of the image in pixels
+            extent (tuple): (xmin, xmax, ymin, ymax), if None it is
+            estimated from a short run
+            walkers (int): number of walkers
+            discard (int): number of steps before points are kept
+            rng (Generator): random stream, the global NumPy state
+            is used if None
+            filename (string): if given, the counts are kept in this
+            memory mapped .npy file
+
+        Returns:
+        --------
+            [DensityGrid]: the grid, also stored as self.grid
+        """
+        if extent is None:
+            extent = self._estimate_extent(rng)
+        grid = DensityGrid(extent, width, filename=filename)
+        for points, colors in self.walk(samples, walkers, discard, rng):
+            grid.add(points, colors)
+        self.grid = grid
+        return grid
+
+    def _estimate_extent(self, rng, samples=2**16):
+        """
+        Private method estimating a window holding the attractor from
+        a short run, padded by 2% on every side.
+
+        Arguments:
+        ----------
+            rng (Generator): random stream, the global NumPy state
+            is used if None
+            samples (int): number of points in the run
+
+        Returns:
+        --------
+            [tuple]: (xmin, xmax, ymin, ymax)
+        """
+        X = np.concatenate([p for p, c in self.walk(samples, 2**12, 20, rng)])
+        return estimate_extent(X, cut=0, pad=0.02)
+
+    @staticmethod
+    def _norms(a, b, c, d):
+        """
+        Private method giving the spectral norm, the largest stretch,
+        of many 2x2 matrices [[a, b], [c, d]] at once.
+
+        Arguments:
+        ----------
+            a, b, c, d (ndarray): entries of the matrices
+
+        Returns:
+        --------
+            [ndarray]: the norms
+        """
+        s = a * a + b * b + c * c + d * d
+        det = a * d - b * c
+        return np.sqrt((s + np.sqrt(np.maximum(s * s - 4 * det * det, 0))) / 2)
+
+    def bounding_ball(self):
+        """
+        Method giving a disk holding the whole attractor. The center c
+        is the mean of the points of a long random walk, which solves
+        c = sum_j p_j f_j(c), and radius R = max |f_j(c) - c| / (1 - ||A_j||)
+        is large enough that every map sends the disk into itself.
+
+        Returns:
+        --------
+            [ndarray]: center, shape (2,)
+            [float]: radius
+        """
+        norms = self._norms(*self._columns[:4])
+        if np.any(norms >= 1):
+            raise ValueError("Needs contractive maps, with norm below 1!")
+        mean_matrix = np.tensordot(self.p_values, self.matrices, axes=1)
+        center = np.linalg.solve(np.eye(2) - mean_matrix, self.p_values @ self.offsets)
+        moved = np.einsum("kij,j->ki", self.matrices, center) + self.offsets - center
+        radius = np.max(np.hypot(moved[:, 0], moved[:, 1]) / (1 - norms))
+        return center, float(radius)
+
+    def enumerate_points(self, leaf_size, max_points=2**20, extent=None, max_depth=200):
+        """
+        Generator covering the attractor deterministically, without a
+        random walk. A branch is a composition P = f_{a_1} o ... o f_{a_m}
+        of maps, and it holds the part P(B) of the attractor, where B is
+        the bounding ball. Branches are expanded one level at a time by
+        broadcasting over all k maps, until ||A_P|| * R is below
+        leaf_size, and then P(center), the mean point of the branch, is
+        yielded with the probability of the branch. When a level would
+        hold more than max_points branches, they are split and finished
+        one after another. With an extent, branches that cannot reach
+        the window are dropped. No random numbers are used, so every
+        run gives the same points.
+
+        Arguments:
+        ----------
+            leaf_size (float): radius below which a branch is a point
+            max_points (int): largest number of branches held at once
+            extent (tuple): optional window (xmin, xmax, ymin, ymax)
+            max_depth (int): level where all branches are yielded
+
+        Yields:
+        --------
+            [tuple]: (X, mass, colors), the points, the probability of
+            their branches and their gradient colors, None without colors
+        """
+        center, radius = self.bounding_ball()
+        # The empty branch is the identity map.
+        branches = np.array([[1.0], [0.0], [0.0], [1.0], [0.0], [0.0]])
+        mass = np.ones(1)
+        colors = None if self.colors is None else np.full(1, 0.5)
+        yield from self._descend(branches, mass, colors, 0, center, radius,
+                                 leaf_size, max_points, extent, max_depth)
+
+    def _descend(self, branches, mass, colors, depth, center, radius,
+                 leaf_size, max_points, extent, max_depth):
+        """
+        Private generator expanding branches until they are leaves, see
+        enumerate_points(). Appending map j to a branch P gives P o f_j,
+        with linear part A_P A_j and translation A_P t_j + t_P.
+
+        Arguments:
+        ----------
+            branches (ndarray): coefficients a, b, c, d, e, f of the
+            branches, shape (6, m)
+            mass (ndarray): probability of every branch
+            colors (ndarray): gradient color of every branch, or None
+            depth (int): number of maps in the branches
+            center (ndarray), radius (float): the bounding ball
+            leaf_size, max_points, extent, max_depth: see enumerate_points()
+
+        Yields:
+        --------
+            [tuple]: (X, mass, colors) of the finished points
+        """
+        k = len(self.p_values)
+        aj, bj, cj, dj, ej, fj = self._columns
+        while len(mass) > 0:
+            a, b, c, d, e, f = branches
+            X = np.column_stack((a * center[0] + b * center[1] + e,
+                                 c * center[0] + d * center[1] + f))
+            r = self._norms(a, b, c, d) * radius
+            keep = mass > 0
+            if extent is not None:
+                xmin, xmax, ymin, ymax = extent
+                dx = np.maximum(np.maximum(xmin - X[:, 0], X[:, 0] - xmax), 0)
+                dy = np.maximum(np.maximum(ymin - X[:, 1], X[:, 1] - ymax), 0)
+                keep &= dx**2 + dy**2 <= r**2
+            leaf = keep & ((r <= leaf_size) | (depth >= max_depth))
+            if leaf.any():
+                yield X[leaf], mass[leaf], None if colors is None else colors[leaf]
+            grow = keep & ~leaf
+            branches = branches[:, grow]
+            mass = mass[grow]
+            if colors is not None:
+                colors = colors[grow]
+            m = len(mass)
+            if m == 0:
+                return
+            if m * k > max_points and m > 1:
+                size = max(1, max_points // k)
+                for i in range(0, m, size):
+                    yield from self._descend(branches[:, i:i + size], mass[i:i + size],
+                                             None if colors is None else colors[i:i + size],
+                                             depth, center, radius, leaf_size,
+                                             max_points, extent, max_depth)
+                return
+
+            a, b, c, d, e, f = (v[:, np.newaxis] for v in branches)
+            branches = np.stack((a * aj + b * cj, a * bj + b * dj,
+                                 c * aj + d * cj, c * bj + d * dj,
+                                 a * ej + b * fj + e, c * ej + d * fj + f)).reshape(6, -1)
+            mass = (mass[:, np.newaxis] * self.p_values).reshape(-1)
+            if colors is not None:
+                # The new map is applied first, so its color is halved depth + 1 times.
+                colors = (colors[:, np.newaxis] + (self.colors - 0.5) / 2**(depth + 1)).reshape(-1)
+            depth += 1
+
+    def render_deterministic(self, width=500, extent=None, samples=10**7, leaf=0.25,
+                             max_points=2**20, filename=None):
+        """
+        Method binning the leaves of enumerate_points() into a
+        DensityGrid. Every leaf counts samples times its probability,
+        so the counts approach the expected counts of a random walk of
+        samples points, without the noise, and are the same every run.
+        The mass of a leaf sits at its mean point, so smaller leaves
+        put less of it in a neighbouring pixel.
+
+        Arguments:
+        ----------
+            width (int): number of pixels along x
+            extent (tuple): (xmin, xmax, ymin, ymax), the box around
+            the bounding ball if None
+            samples (int): number of points the counts correspond to
+            leaf (float): size of the leaves in pixels
+            max_points (int): largest number of branches held at once
+            filename (string): if given, the counts are kept in this
+            memory mapped .npy file
+
+        Returns:
+        --------
+            [DensityGrid]: the grid, also stored as self.grid
+        """
+        if extent is None:
+            center, radius = self.bounding_ball()
+            extent = (center[0] - radius, center[0] + radius,
+                      center[1] - radius, center[1] + radius)
+        grid = DensityGrid(extent, width, filename=filename)
+        pixel = (grid.extent[1] - grid.extent[0]) / grid.width
+        for points, mass, colors in self.enumerate_points(leaf * pixel, max_points, extent):
+            grid.add(points, colors, weights=samples * mass)
+        self.grid = grid
+        return grid
+
+
+def convergence_report(systems, width=100, targets=(0.2, 0.1, 0.05), coverage=(0.9, 0.99),
+                       max_points=10**7, walkers=2**14, extent=None, leaf=0.1, rng=None):
+    """
+    Function comparing how fast different versions of an IFS, e.g. with
+    different probabilities, converge to their own density. The
+    reference density of every system is its render_deterministic()
+    histogram, normalized to sum 1. Every system is then run once for
+    max_points, and after every step of the walkers the L1 error
+    sum |counts / total - reference| is measured. A system reaches a
+    target once its error drops below it. As extra column, the number
+    of points until a fraction of the attractor (the union of the hit
+    pixels of all systems) has been hit is reported.
+
+    Arguments:
+    ----------
+        systems (dict): label -> IFS, all with the same attractor
+        width (int): width of the pixel grid
+        targets (tuple): L1 density errors to reach, the reference
+        itself is off by about 0.02 with the default leaf
+        coverage (tuple): fractions of the attractor to reach
+        max_points (int): number of points per system
+        walkers (int): number of walkers, also the resolution of the
+        point counts
+        extent (tuple): (xmin, xmax, ymin, ymax), if None it is
+        estimated from the first system
+        leaf (float): leaf size in pixels of the reference renders
+        rng (Generator): random stream, the global NumPy state is used
+        if None
+
+    Returns:
+    --------
+        [dict]: label -> {"error": {target: points needed},
+        "coverage": {fraction: points needed}, "final_error": float},
+        with None where a target was not reached within max_points
+    """
+    if max_points <= 0:
+        raise ValueError("max_points needs to be positive!")
+    systems = dict(systems)
+    if extent is None:
+        extent = next(iter(systems.values()))._estimate_extent(rng)
+
+    report = {}
+    first_hit = {}
+    for label, ifs in systems.items():
+        reference = ifs.render_deterministic(width, extent, samples=1, leaf=leaf).counts
+        reference = reference / reference.sum()
+        grid = DensityGrid(extent, width)
+        first = np.full(grid.counts.shape, np.inf)
+        reached = dict.fromkeys(targets)
+        error = np.inf
+        for points, colors in ifs.walk(max_points, walkers, rng=rng):
+            grid.add(points)
+            new = (grid.counts > 0) & np.isinf(first)
+            first[new] = grid.total
+            error = np.abs(grid.counts / grid.total - reference).sum()
+            for target in targets:
+                if reached[target] is None and error <= target:
+                    reached[target] = int(grid.total)
+        first_hit[label] = first
+        report[label] = {"error": reached, "final_error": float(error)}
+
+    attractor = np.zeros(grid.counts.shape, dtype=bool)
+    for first in first_hit.values():
+        attractor |= np.isfinite(first)
+    size = np.count_nonzero(attractor)
+    for label, first in first_hit.items():
+        times = np.sort(first[attractor])
+        report[label]["coverage"] = {}
+        for fraction in coverage:
+            t = times[max(0, int(np.ceil(fraction * size)) - 1)]
+            report[label]["coverage"][fraction] = int(t) if np.isfinite(t) else None
+    return report
 
-    for i in range(1, steps + discard):
-        a, b, c, d, e, f = choose(p_values, functions)
-        F = Affinetransform(a, b, c, d, e, f)
-        X_prev = F(X_prev[0], X_prev[1])
-        X.append(X_prev)
-    X = np.array(X)
-    return X[discard:]
 
 if __name__ == '__main__':
+    import argparse
 
-    f1 = [0, 0, 0, 0.16, 0, 0]
-    f2 = [0.85, 0.04, -0.04, 0.85, 0, 1.60]
-    f3 = [0.20, -0.26, 0.23, 0.22, 0, 1.60]
-    f4 = [-0.15, 0.28, 0.26, 0.24, 0, 0.44]
+    parser = argparse.ArgumentParser(description="Plot the Barnsley fern.")
+    parser.add_argument("--report", action="store_true",
+                        help="compare the given and determinant weighted probabilities")
+    args = parser.parse_args()
 
-    functions = [f1, f2, f3, f4]
-    p_values = [0.01, 0.85, 0.07, 0.07]
+    fern = load_ifs(os.path.join(os.path.dirname(__file__), "barnsley_fern.json"))
 
     steps = 50000
     discard = 5
-    X = iterate(steps, discard, functions)
+    X = fern.iterate(steps, discard)
     plt.axis('equal')
     plt.axis('off')
     plt.scatter(*zip(*X), s=0.1, marker=".", color= "forestgreen")
     plt.savefig("figures/barnsley_fern.png")
     plt.show()
+
+    if args.report:
+        report = convergence_report({"given": fern,
+                                     "determinant": fern.with_determinant_p_values()})
+        for label, result in report.items():
+            print(label, ", ".join(
+                [f"error {target} in {points} points" for target, points in result["error"].items()]
+                + [f"{fraction:.0%} covered in {points} points"
+                   for fraction, points in result["coverage"].items()]))
@@ -0,0 +1,254 @@
+import numpy as np
+import matplotlib.pyplot as plt
+
+from density import DensityGrid, estimate_extent
+from variations import Variations
+
+
+class FlameMap:
+    """
+    ==============================================
+    Class FlameMap holding one map of a fractal flame:
+    an affine transformation, a weighted blend of
+    variations and a color index.
+    ==============================================
+    """
+    def __init__(self, coeffs, variations, color=0.0, weight=1.0):
+        """
+        Constructs all necessary attributes for the map object
+        Arguments:
+        ----------
+            coeffs (list): (a, b, c, d, e, f), the affine part
+            x' = a*x + b*y + e, y' = c*x + d*y + f
+            variations (dict): variation name -> weight in the blend
+            color (float): color index in [0, 1]
+            weight (float): relative probability of picking this map
+        """
+        if len(coeffs) != 6:
+            raise ValueError("Needs six affine coefficients a, b, c, d, e, f!")
+        for name in variations:
+            if name not in Variations.names:
+                raise ValueError(f"Unknown variation {name}!")
+        if not (0 <= color <= 1):
+            raise ValueError("Color needs to be between 0 and 1!")
+        if not weight > 0:
+            raise ValueError("Weight needs to be positive!")
+        self.coeffs = np.array(coeffs, dtype=float)
+        self.variations = dict(variations)
+        self.color = float(color)
+        self.weight = float(weight)
+
+
+class Flame:
+    """
+    ==============================================
+    Class Flame rendering a fractal flame: a random
+    IFS walk where every map is an affine step followed
+    by a blend of Variations, run for many walkers at
+    once and accumulated into a log-density histogram.
+    ==============================================
+    """
+    def __init__(self, maps):
+        """
+        Constructs all necessary attributes for the flame object
+        Arguments:
+        ----------
+            maps (list): FlameMap objects
+        """
+        if len(maps) == 0:
+            raise ValueError("Needs at least one map!")
+        self.maps = list(maps)
+        weights = np.array([m.weight for m in self.maps])
+        self._cumulative = np.cumsum(weights / weights.sum())
+        self._cumulative[-1] = 1.0
+        self.grid = None
+
+    @classmethod
+    def from_chaos_game(cls, game, variations):
+        """
+        Method building a flame from the maps of a ChaosGame, one map
+        per vertex moving a fraction 1 - r towards it, all with the
+        same blend of variations and the vertex index as color.
+
+        Arguments:
+        ----------
+            game (ChaosGame): the game giving n, r and the vertices
+            variations (dict): variation name -> weight in the blend
+
+        Returns:
+        --------
+            [Flame]: the new flame
+        """
+        r = game.r
+        maps = []
+        for k, corner in enumerate(game._c_marked):
+            e, f = (1 - r) * corner
+            maps.append(FlameMap((r, 0, 0, r, e, f), variations,
+                                 color=k / max(1, game.n - 1)))
+        return cls(maps)
+
+    def _apply(self, j, x, y):
+        """
+        Private method applying map j to a group of walkers.
+
+        Arguments:
+        ----------
+            j (int): index of the map
+            x, y (ndarray): positions of the walkers
+
+        Returns:
+        --------
+            [ndarray]: new x and y positions
+        """
+        m = self.maps[j]
+        a, b, c, d, e, f = m.coeffs
+        xa = a * x + b * y + e
+        ya = c * x + d * y + f
+        names = list(m.variations)
+        if names == ["linear"]:
+            w = m.variations["linear"]
+            return w * xa, w * ya
+        UV = Variations.transform_many(xa, ya, names)
+        weights = np.array([m.variations[name] for name in names])
+        u, v = np.tensordot(weights, UV, axes=1)
+        return u, v
+
+    def walk(self, samples, walkers=2**16, discard=20, rng=None):
+        """
+        Generator running the walkers in lockstep. At every step each
+        walker picks its own map, the walkers are grouped by map and
+        every group is moved with one vectorized call. Walkers that
+        leave the plane (inf or nan) are restarted at random with a new
+        color, and like all walkers they are only yielded after discard
+        steps of their own.
+
+        Arguments:
+        ----------
+            samples (int): number of points to yield in total
+            walkers (int): number of walkers
+            discard (int): number of steps before points are yielded
+            rng (Generator): random stream, the global NumPy state is
+            used if None
+
+        Yields:
+        --------
+            [tuple]: (X, colors), the positions and color indices of the
+            walkers past their first discard steps, after every step
+        """
+        if rng is None:
+            rng = np.random
+        colors_of = np.array([m.color for m in self.maps])
+        x = rng.uniform(-1, 1, walkers)
+        y = rng.uniform(-1, 1, walkers)
+        c = rng.random(walkers)
+        age = np.zeros(walkers, dtype=int)
+
+        while samples > 0:
+            idx = np.searchsorted(self._cumulative, rng.random(walkers), side="right")
+            idx = np.minimum(idx, len(self.maps) - 1)
+            for j in range(len(self.maps)):
+                sel = idx == j
+                if sel.any():
+                    x[sel], y[sel] = self._apply(j, x[sel], y[sel])
+            c = (c + colors_of[idx]) / 2
+            age += 1
+
+            lost = ~(np.isfinite(x) & np.isfinite(y))
+            if lost.any():
+                x[lost] = rng.uniform(-1, 1, lost.sum())
+                y[lost] = rng.uniform(-1, 1, lost.sum())
+                c[lost] = rng.random(lost.sum())
+                age[lost] = 0
+
+            ready = np.flatnonzero(age > discard)[:samples]
+            if ready.size:
+                yield np.column_stack((x[ready], y[ready])), c[ready]
+                samples -= ready.size
+
+    def render(self, samples, width=500, extent=None, supersample=2,
+               walkers=2**16, discard=20, rng=None, filename=None):
+        """
+        Method rendering the flame into a DensityGrid, with supersample
+        times more pixels per side than the final image. The colors are
+        averaged per pixel, so the grid can be tone mapped with a log
+        scale and gamma through to_rgba() after downsample().
+
+        Arguments:
+        ----------
+            samples (int): number of points
+            width (int): width of the final image in pixels
+            extent (tuple): (xmin, xmax, ymin, ymax), if None it is
+            estimated from a short run
+            supersample (int): pixels per side and final pixel
+            walkers (int): number of walkers
+            discard (int): number of steps before points are kept
+            rng (Generator): random stream, the global NumPy state is
+            used if None
+            filename (string): if given, the counts are kept in this
+            memory mapped .npy file
+
+        Returns:
+        --------
+            [DensityGrid]: the supersampled grid, also stored as self.grid
+        """
+        if extent is None:
+            extent = self._estimate_extent(rng)
+        grid = DensityGrid(extent, width * supersample, filename=filename)
+        for points, colors in self.walk(samples, walkers, discard, rng):
+            grid.add(points, colors)
+        self.supersample = supersample
+        self.grid = grid
+        return grid
+
+    def _estimate_extent(self, rng, samples=2**16):
+        """
+        Private method estimating a window holding almost all of the
+        flame from a short run, see estimate_extent().
+
+        Arguments:
+        ----------
+            rng (Generator): random stream, the global NumPy state is
+            used if None
+            samples (int): number of points in the run
+
+        Returns:
+        --------
+            [tuple]: (xmin, xmax, ymin, ymax)
+        """
+        X = np.concatenate([p for p, c in self.walk(samples, 2**12, 20, rng)])
+        return estimate_extent(X)
+
+    def image(self, cmap="inferno", gamma=2.2):
+        """
+        Method giving the final RGBA image: the supersampled grid is
+        reduced to the output size, then tone mapped with a log scale
+        and gamma, colored by the mean color index of every pixel.
+
+        Arguments:
+        ----------
+            cmap (colormap): Certain set of colors.
+            gamma (float): gamma correction
+
+        Returns:
+        --------
+            [ndarray]: Array of shape (height, width, 4) in [0, 1]
+        """
+        grid = self.grid.downsample(self.supersample)
+        return grid.to_rgba(cmap=cmap, gamma=gamma, vmin=0, vmax=1)
+
+
+if __name__ == "__main__":
+    from chaos_game import ChaosGame
+
+    import time
+
+    game = ChaosGame(4, 1 / 3)
+    flame = Flame.from_chaos_game(game, {"linear": 0.6, "disc": 0.2, "swirl": 0.2})
+    start = time.perf_counter()
+    flame.render(10**7, width=800)
+    seconds = time.perf_counter() - start
+    print(f"{10**7 / seconds:.3g} samples per second")
+
+    plt.imshow(flame.image(), extent=flame.grid.extent)
+    plt.axis("off")
+    plt.show()
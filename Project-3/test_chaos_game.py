@@ -1,6 +1,8 @@
 from chaos_game import ChaosGame
+from density import DensityGrid
 import numpy as np
 import matplotlib.pyplot as plt
+import os
 
 
 def test_correct_r():
@@ -43,3 +45,234 @@ def test_random():
         test.iterate(10000)
         test.plot_ngon()
         plt.show()
+
+
+def test_iterate_matches_loop():
+    # The vectorized iterate should give the same points as the plain loop.
+    tol = 1e-12
+    f = ChaosGame(5, 3 / 8)
+    f._starting_point()
+    np.random.seed(2020)
+    f.iterate(steps=5000, discard=5)
+
+    np.random.seed(2020)
+    k = np.random.randint(f.n, size=5004)
+    X = np.zeros((5005, 2))
+    X[0] = f.X
+    for i in range(5004):
+        X[i + 1] = f.r * X[i] + (1 - f.r) * f._c_marked[k[i]]
+
+    success = np.max(abs(f.X_next - X[5:])) < tol and np.all(f.colors == k[4:])
+    msg = "Vectorized iterate does not match the loop version!"
+    assert success, msg
+
+
+def test_render_matches_iterate():
+    # Binning while iterating should give the same grid as binning X_next.
+    f = ChaosGame(4, 1 / 3)
+    f._starting_point()
+    np.random.seed(1910)
+    f.iterate(steps=20000, discard=5)
+    np.random.seed(1910)
+    grid = f.render(steps=20000, discard=5, width=200, chunk=3000)
+
+    expected = DensityGrid(f._extent(), 200)
+    expected.add(f.X_next, f.C)
+    success = (np.array_equal(grid.counts, expected.counts) and grid.total == 20000
+               and np.allclose(grid.values, expected.values))
+    msg = "The density grid does not match the iterated points!"
+    assert success, msg
+
+
+def test_chunks_bounded():
+    # An endless stream should only ever hand out chunks of the given size.
+    f = ChaosGame(3, 1 / 2)
+    f._starting_point()
+    sizes = []
+    for points, colors, C in f.chunks(steps=None, chunk=500):
+        sizes.append(len(points))
+        if len(sizes) == 10:
+            break
+    success = sizes == [500] * 10
+    msg = f"Unexpected chunk sizes {sizes}"
+    assert success, msg
+
+
+def test_render_parallel_seeded():
+    # A seeded parallel render should not depend on how many processes run it.
+    f = ChaosGame(5, 1 / 3)
+    serial = f.render_parallel(30001, chains=3, processes=1, width=100, seed=42)
+    pooled = f.render_parallel(30001, chains=3, processes=2, width=100, seed=42)
+    success = serial.total == 30001 and np.array_equal(serial.counts, pooled.counts)
+    msg = "Parallel render is not reproducible from its seed!"
+    assert success, msg
+
+
+def test_gradient_color_single_pass():
+    # The fused colors should follow C_{i+1} = (C_i + k)/2 and honor discard.
+    tol = 1e-12
+    f = ChaosGame(3, 1 / 2)
+    f._starting_point()
+    f.iterate(steps=2000, discard=10)
+    C, X = f._gradient_color()
+
+    expected = (C[:-1] + f.colors[1:]) / 2
+    success = (len(C) == len(X) == 2000 and X is f.X_next
+               and np.max(abs(C[1:] - expected)) < tol)
+    msg = "Gradient colors do not follow the running average!"
+    assert success, msg
+
+
+def test_enumerate_points_chunked():
+    # Splitting into chunks under a memory cap should not change the points.
+    f = ChaosGame(3, 1 / 2)
+    full = [(X, c) for X, c in f.enumerate_points(6)]
+    parts = [(X, c) for X, c in f.enumerate_points(6, max_points=30)]
+    X_full = np.concatenate([X for X, c in full])
+    X_parts = np.concatenate([X for X, c in parts])
+
+    success = (len(full) == 1 and len(parts) > 1 and len(X_full) == 3**6
+               and np.allclose(X_full, X_parts)
+               and max(len(X) for X, c in parts) <= 30)
+    msg = "Chunked enumeration differs from the full enumeration!"
+    assert success, msg
+
+
+def test_render_memmap(tmp_path):
+    # A grid on disk, tone mapped in tiles, should match the one in RAM.
+    f = ChaosGame(3, 1 / 2)
+    f._starting_point()
+    np.random.seed(7)
+    in_ram = f.render(steps=50000, width=120)
+    np.random.seed(7)
+    on_disk = f.render(steps=50000, width=120, chunk=1000,
+                       filename=str(tmp_path / "counts.npy"))
+    image = on_disk.write_tiles(str(tmp_path / "image.npy"), tile=50)
+
+    assert np.array_equal(in_ram.counts, on_disk.counts), \
+        "Memory mapped render differs from the in-memory render!"
+    assert np.array_equal(image, np.round(255 * in_ram.image())), \
+        "Tiled image differs from the in-memory image!"
+
+
+def _colored_grid(tmp_path):
+    # A small memory mapped grid with gradient colors.
+    f = ChaosGame(3, 1 / 2)
+    f._starting_point()
+    return f.render(steps=20000, width=60, filename=str(tmp_path / "counts.npy"))
+
+
+def test_save_color_png(tmp_path):
+    # The colored PNG, written in blocks of rows, matches to_rgba().
+    import matplotlib.image as mpimg
+    from density import write_png
+
+    grid = _colored_grid(tmp_path)
+    grid.save(str(tmp_path / "color.png"), color=True)
+    write_png(str(tmp_path / "expected.png"), grid.to_rgba())
+    success = np.array_equal(mpimg.imread(str(tmp_path / "color.png")),
+                             mpimg.imread(str(tmp_path / "expected.png")))
+    msg = "Colored PNG written in blocks differs from to_rgba()!"
+    assert success, msg
+
+
+def test_blocks_cover_grid(tmp_path):
+    # Blocks of rows cover the whole grid, the last one may be shorter.
+    grid = _colored_grid(tmp_path)
+    blocks = list(grid.blocks(color=True, rows=7))
+    success = (len(blocks) == -(-grid.height // 7)
+               and sum(len(b) for b in blocks) == grid.height
+               and blocks[0].shape[1:] == (grid.width, 4))
+    msg = "Blocks do not cover the grid!"
+    assert success, msg
+
+
+def test_save_leaves_no_side_files(tmp_path):
+    # Saving a memory mapped grid writes only the requested file.
+    grid = _colored_grid(tmp_path)
+    grid.save(str(tmp_path / "gray.png"))
+    grid.save(str(tmp_path / "color.png"), color=True)
+    success = sorted(os.listdir(tmp_path)) == ["color.png", "counts.npy",
+                                               "counts_values.npy", "gray.png"]
+    msg = "Saving the grid left extra files!"
+    assert success, msg
+
+
+def test_enumerate_points_window():
+    # Pruning must keep every point that falls inside the window.
+    f = ChaosGame(5, 3 / 8)
+    xmin, xmax, ymin, ymax = 0.1, 0.3, -0.2, 0.0
+    full = np.concatenate([X for X, c in f.enumerate_points(7)])
+    pruned = np.concatenate([X for X, c in f.enumerate_points(7, extent=(xmin, xmax, ymin, ymax))])
+
+    def inside(X):
+        return X[(X[:, 0] >= xmin) & (X[:, 0] <= xmax) & (X[:, 1] >= ymin) & (X[:, 1] <= ymax)]
+
+    success = len(pruned) < len(full) and np.allclose(inside(full), inside(pruned))
+    msg = "Viewport pruning lost points inside the window!"
+    assert success, msg
+
+
+def test_savepng_grid(tmp_path):
+    # A rendered grid is written straight to the given path.
+    import matplotlib.image as mpimg
+
+    f = ChaosGame(3, 1 / 2)
+    f._starting_point()
+    grid = f.render(steps=20000, width=150)
+    f.savepng(str(tmp_path / "sierpinski"), source="grid")
+    f.savepng(str(tmp_path / "counts.npy"), source="grid")
+
+    image = mpimg.imread(str(tmp_path / "sierpinski.png"))
+    counts = np.load(str(tmp_path / "counts.npy"))
+    success = (image.shape == grid.counts.shape
+               and np.allclose(image, np.round(255 * grid.image()) / 255)
+               and np.array_equal(counts, grid.counts))
+
+    # Nothing to save, or a wrong extension, is an error.
+    for outfile, source in [("points.npy", "points"), ("image.jpg", "figure")]:
+        try:
+            ChaosGame(3, 1 / 2).savepng(str(tmp_path / outfile), source=source)
+            success = False
+        except ValueError:
+            pass
+    msg = "Saved grid differs from the rendered grid!"
+    assert success, msg
+
+
+def test_box_dimension_sierpinski():
+    # The Sierpinski triangle has dimension log(3)/log(2).
+    from dimension import box_dimension
+
+    tol = 0.05
+    f = ChaosGame(3, 1 / 2)
+    f._starting_point()
+    computed = box_dimension(f.chunks(steps=500000), f._extent(), levels=9)
+    expected = np.log(3) / np.log(2)
+    success = abs(computed - expected) < tol
+    msg = f"Box dimension is {computed:.3f}, expected {expected:.3f}"
+    assert success, msg
+
+
+def test_render_until_converges():
+    # A loose tolerance should stop long before max_steps.
+    f = ChaosGame(3, 1 / 2)
+    f._starting_point()
+    grid = f.render_until(tol=0.1, width=100, first_check=2**14, max_steps=10**8)
+    report = f.convergence
+    success = (report["converged"] and report["change"] < 0.1
+               and report["steps"] == grid.total < 10**8)
+    msg = f"Progressive render did not converge: {report}"
+    assert success, msg
+
+
+def test_starting_points_inside():
+    # Convex combinations of the vertices stay inside the n-gon.
+    f = ChaosGame(6, 1 / 3)
+    X = f.starting_points(1000)
+    radius = np.cos(np.pi / 6)
+    angles = np.arctan2(X[:, 0], X[:, 1]) % (np.pi / 3) - np.pi / 6
+    inside = np.hypot(X[:, 0], X[:, 1]) * np.cos(angles) <= radius + 1e-12
+    success = X.shape == (1000, 2) and np.all(inside) and f._c_marked is ChaosGame(6, 1 / 2)._c_marked
+    msg = "Starting points outside the n-gon or vertex table not cached!"
+    assert success, msg
@@ -0,0 +1,149 @@
+from density import DensityGrid
+from fern import Affinetransform, IFS, load_ifs, convergence_report
+import numpy as np
+import os
+
+FUNCTIONS = [
+    [0, 0, 0, 0.16, 0, 0],
+    [0.85, 0.04, -0.04, 0.85, 0, 1.60],
+    [0.20, -0.26, 0.23, 0.22, 0, 1.60],
+    [-0.15, 0.28, 0.26, 0.24, 0, 0.44],
+]
+P_VALUES = [0.01, 0.85, 0.07, 0.07]
+
+
+def test_ifs_iterate_matches_loop():
+    # The vectorized orbit follows the same path as applying the maps one at a time.
+    tol = 1e-10
+    ifs = IFS.from_functions(FUNCTIONS, P_VALUES)
+    transforms = [Affinetransform(*f) for f in FUNCTIONS]
+    X = ifs.iterate(1000, discard=0, chunk=300, rng=np.random.default_rng(1910))
+    # chunks() draws the indices per chunk, after the starting point.
+    rng = np.random.default_rng(1910)
+    idx = np.concatenate([ifs.choose(size, rng) for size in (300, 300, 300, 99)])
+    point = np.zeros(2)
+    loop = [point]
+    for j in idx:
+        point = transforms[j](*point)
+        loop.append(point)
+    success = X.shape == (1000, 2) and np.max(abs(X - np.array(loop))) < tol
+    msg = "IFS.iterate differs from the loop over Affinetransform!"
+    assert success, msg
+
+
+def test_ifs_choose_probabilities():
+    # The drawn map indices follow the given probabilities.
+    ifs = IFS.from_transforms([Affinetransform(*f) for f in FUNCTIONS], P_VALUES)
+    idx = ifs.choose(10**6, np.random.default_rng(1))
+    freq = np.bincount(idx, minlength=4) / 10**6
+    success = np.allclose(freq, P_VALUES, atol=3e-3)
+    msg = "IFS.choose does not follow the probabilities!"
+    assert success, msg
+
+
+def test_ifs_walkers_match_orbit():
+    # The walker ensemble fills the same density as one long orbit.
+    tol = 0.08
+    ifs = IFS.from_functions(FUNCTIONS, P_VALUES)
+    extent = (-3, 3, -0.5, 10.5)
+    grid = ifs.render(200000, width=10, extent=extent, walkers=5000,
+                      rng=np.random.default_rng(1910))
+    X = ifs.iterate(200000, rng=np.random.default_rng(1910))
+    H, _, _ = np.histogram2d(X[:, 1], X[:, 0], bins=grid.counts.shape,
+                             range=[extent[2:], extent[:2]])
+    difference = np.abs(grid.counts[::-1] / grid.total - H / len(X)).sum()
+    success = grid.total == 200000 and ifs.grid is grid and difference < tol
+    msg = "Walker ensemble density differs from the single orbit!"
+    assert success, msg
+
+
+def test_load_ifs(tmp_path):
+    # The shipped JSON and an equal TOML definition give the fern, bad ones are refused.
+    ifs = load_ifs(os.path.join(os.path.dirname(__file__), "barnsley_fern.json"))
+    toml = tmp_path / "fern.toml"
+    toml.write_text("".join(
+        f"[[maps]]\ncoeffs = {list(map(float, f))}\nprobability = {p}\n\n"
+        for f, p in zip(FUNCTIONS, P_VALUES)))
+    other = load_ifs(str(toml))
+    success = (ifs.name == "barnsley_fern" and ifs.colors.shape == (4,)
+               and np.allclose(ifs.matrices.reshape(-1, 4), np.array(FUNCTIONS)[:, :4])
+               and np.allclose(ifs.offsets, np.array(FUNCTIONS)[:, 4:])
+               and np.allclose(ifs.p_values, P_VALUES)
+               and np.allclose(other.matrices, ifs.matrices) and np.allclose(other.offsets, ifs.offsets)
+               and other.colors is None)
+    bad = [{"maps": []},
+           {"maps": [{"coeffs": [1, 0, 0, 1, 0], "probability": 1}]},
+           {"maps": [{"coeffs": [0.5, 0, 0, 0.5, 0, 0], "probability": 0.5}]},
+           {"maps": [{"coeffs": [0.5, 0, 0, 0.5, 0, 0], "probability": 0.5, "color": 0},
+                     {"coeffs": [0.5, 0, 0, 0.5, 1, 0], "probability": 0.5}]}]
+    for definition in bad:
+        try:
+            IFS.from_dict(definition)
+            success = False
+        except ValueError:
+            pass
+    msg = "IFS definition loaded wrongly or not validated!"
+    assert success, msg
+
+
+def test_determinant_p_values():
+    # Determinant weights of the fern, and a density error that falls
+    # below the target with fewer points than with the given weights.
+    success = np.allclose(IFS.determinant_p_values(np.array(FUNCTIONS)[:, :4].reshape(-1, 2, 2)),
+                          np.array([0.01, 0.7241, 0.1038, 0.1088]) / 0.9467, atol=1e-4)
+    given = IFS.from_functions(FUNCTIONS, P_VALUES)
+    report = convergence_report({"given": given, "determinant": given.with_determinant_p_values()},
+                                width=40, targets=(0.2,), coverage=(0.9,), max_points=10**6,
+                                walkers=2**12, extent=(-3, 3, -0.5, 10.5),
+                                rng=np.random.default_rng(1910))
+    for label in ["given", "determinant"]:
+        success = (success and report[label]["final_error"] < 0.1
+                   and report[label]["coverage"][0.9] is not None)
+    success = success and report["determinant"]["error"][0.2] < report["given"]["error"][0.2]
+    msg = "Determinant weighted probabilities do not converge faster!"
+    assert success, msg
+
+
+def test_convergence_report_needs_points():
+    # Without any points there is no error to report, so it is refused.
+    ifs = IFS.from_functions(FUNCTIONS, P_VALUES)
+    try:
+        convergence_report({"given": ifs}, max_points=0, extent=(-3, 3, -0.5, 10.5))
+        success = False
+    except ValueError:
+        success = True
+    msg = "convergence_report accepted max_points <= 0!"
+    assert success, msg
+
+
+def test_render_deterministic():
+    # Same counts every run, the whole probability inside the ball, and
+    # about the density of a long random walk.
+    tol = 0.1
+    ifs = IFS.from_functions(FUNCTIONS, P_VALUES)
+    extent = (-3, 3, -0.5, 10.5)
+    first = ifs.render_deterministic(width=20, extent=extent, samples=10**6, leaf=0.1)
+    second = ifs.render_deterministic(width=20, extent=extent, samples=10**6, leaf=0.1)
+    assert np.array_equal(first.counts, second.counts), "Deterministic render is not reproducible!"
+    assert abs(first.counts.sum() - 10**6) < 1e-3 and abs(first.total - 10**6) < 1e-3, \
+        "Deterministic render does not hold all samples!"
+
+    center, radius = ifs.bounding_ball()
+    X = np.concatenate([p for p, m, c in ifs.enumerate_points(0.05)])
+    assert np.all(np.hypot(*(X - center).T) <= radius), "Points lie outside the bounding ball!"
+
+    walk = ifs.render(10**6, width=20, extent=extent, rng=np.random.default_rng(1910))
+    difference = np.abs(first.counts - walk.counts).sum() / 10**6
+    assert difference < tol, f"Density differs from a random walk by {difference:.3f}!"
+
+
+def test_weights_need_float_counts():
+    # Fractional weights cannot be added to integer counts.
+    grid = DensityGrid((-1, 1, -1, 1), 20, dtype=np.uint32)
+    try:
+        grid.add(np.zeros((3, 2)), weights=[0.4] * 3)
+        success = False
+    except TypeError:
+        success = True
+    msg = "Weights were added to integer counts!"
+    assert success, msg
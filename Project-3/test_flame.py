@@ -0,0 +1,35 @@
+from chaos_game import ChaosGame
+from flame import Flame, FlameMap
+import numpy as np
+
+
+def test_flame_render_counts():
+    # Every sample lands in the supersampled grid, and downsampling keeps them.
+    game = ChaosGame(3, 1 / 2)
+    flame = Flame.from_chaos_game(game, {"linear": 1.0})
+    rng = np.random.default_rng(1910)
+    grid = flame.render(50000, width=100, extent=(-1, 1, -1, 1), supersample=2,
+                        walkers=1000, rng=rng)
+    small = grid.downsample(2)
+    image = flame.image()
+    success = (grid.total == 50000 and grid.counts.sum() == 50000
+               and small.counts.sum() == 50000 and image.shape == (100, 100, 4))
+    msg = "Flame render lost samples!"
+    assert success, msg
+
+
+def test_flame_restart_burn_in():
+    # A map with nan coefficients loses every walker picking it. Restarted
+    # walkers are only yielded after discard steps of their own towards the
+    # origin, with a fresh color, and exactly the requested samples are kept.
+    discard = 8
+    flame = Flame([FlameMap((0.5, 0, 0, 0.5, 0, 0), {"linear": 1.0}, color=0, weight=0.9),
+                   FlameMap((np.nan, 0, 0, np.nan, 0, 0), {"linear": 1.0}, color=1, weight=0.1)])
+    chunks = list(flame.walk(20000, walkers=1000, discard=discard,
+                             rng=np.random.default_rng(1910)))
+    X = np.concatenate([p for p, c in chunks])
+    colors = np.concatenate([c for p, c in chunks])
+    success = (len(X) == 20000 and np.abs(X).max() <= 2.0**-discard
+               and colors.max() <= 2.0**-discard)
+    msg = "Restarted flame walkers were yielded before their burn-in!"
+    assert success, msg
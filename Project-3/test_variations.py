@@ -0,0 +1,194 @@
+from variations import Variations
+import numpy as np
+
+
+def test_transform_many_matches_transform():
+    # The batch API should give the same values as one transform per name.
+    tol = 1e-12
+    x = np.random.uniform(-1, 1, 1000)
+    y = np.random.uniform(-1, 1, 1000)
+    UV = Variations.transform_many(x, y, Variations.names)
+    success = UV.shape == (len(Variations.names), 2, 1000)
+    for i, name in enumerate(Variations.names):
+        u, v = Variations(x, y, name).transform()
+        success = success and np.max(abs(UV[i, 0] - u)) < tol and np.max(abs(UV[i, 1] - v)) < tol
+    msg = "transform_many differs from transform!"
+    assert success, msg
+
+
+def test_transform_blocks_and_float32():
+    # Block-wise transforms into a given buffer, also in float32.
+    x = np.random.uniform(-1, 1, 1001)
+    y = np.random.uniform(-1, 1, 1001)
+    success = True
+    for name in Variations.names:
+        u, v = Variations(x, y, name).transform()
+        out = np.empty((2, 1001))
+        Variations(x, y, name).transform(out=out, block=100)
+        u32, v32 = Variations(x, y, name, dtype=np.float32).transform(block=100)
+        success = (success and np.allclose(out[0], u) and np.allclose(out[1], v)
+                   and u32.dtype == np.float32
+                   and np.allclose(u32, u, atol=1e-4) and np.allclose(v32, v, atol=1e-4))
+
+    # A 2-D grid keeps its shape through the blocks.
+    X, Y = np.meshgrid(np.linspace(-1, 1, 30), np.linspace(-1.1, 0.9, 40))
+    for name in Variations.names:
+        U, V = Variations(X, Y, name).transform()
+        Ub, Vb = Variations(X, Y, name).transform(block=7)
+        success = (success and Ub.shape == X.shape
+                   and np.allclose(Ub, U) and np.allclose(Vb, V))
+    msg = "Block-wise or float32 transform differs from the plain transform!"
+    assert success, msg
+
+
+def test_linear_combination_sweep():
+    # The broadcast sweep and the frame generator match the closure.
+    tol = 1e-12
+    x = np.random.uniform(-1, 1, 500)
+    y = np.random.uniform(-1, 1, 500)
+    var = Variations(x, y, "linear")
+    V1 = Variations(x, y, "linear").transform()
+    V2 = Variations(x, y, "disc").transform()
+    weights = np.linspace(0, 1, 7)
+
+    V12 = var.linear_combination_wrap(V1, V2)
+    frames = var.linear_combination_sweep(V1, V2, weights)
+    success = frames.shape == (7, 2, 500)
+    for w, frame, streamed in zip(weights, frames, var.linear_combination_frames(V1, V2, weights)):
+        u, v = V12(w)
+        success = (success and np.max(abs(frame[0] - u)) < tol and np.max(abs(frame[1] - v)) < tol
+                   and np.max(abs(streamed - frame)) < tol)
+    msg = "Weight sweep differs from linear_combination_wrap!"
+    assert success, msg
+
+
+def test_linear_combination_sweep_int_inputs():
+    # Integer points through "linear" stay ints, fractional weights must not be truncated.
+    tol = 1e-12
+    x = y = np.arange(-3, 4)
+    var = Variations(x, y, "linear")
+    V1 = var.transform()
+    V2 = Variations(x, y, "handkerchief").transform()
+    weights = [0.5]
+    u, v = var.linear_combination_wrap(V1, V2)(0.5)
+    frame = var.linear_combination_sweep(V1, V2, weights)[0]
+    streamed = next(var.linear_combination_frames(V1, V1, weights))
+    success = (np.max(abs(frame[0] - u)) < tol and np.max(abs(frame[1] - v)) < tol
+               and streamed.dtype == np.float64 and np.max(abs(streamed - V1)) < tol)
+    msg = "Weight sweep truncates the weights for integer inputs!"
+    assert success, msg
+
+
+def test_transform_threads():
+    # The thread pool writes every block into the shared output.
+    x = np.random.uniform(-1, 1, 10007)
+    y = np.random.uniform(-1, 1, 10007)
+    success = True
+    for name in Variations.names:
+        u, v = Variations(x, y, name).transform()
+        up, vp = Variations(x, y, name).transform(block=1000, workers=3)
+        success = success and np.allclose(up, u) and np.allclose(vp, v)
+
+    X, Y = np.meshgrid(np.linspace(-1, 1, 30), np.linspace(-1.1, 0.9, 40))
+    for name in Variations.names:
+        U, V = Variations(X, Y, name).transform()
+        Up, Vp = Variations(X, Y, name).transform(block=100, workers=2)
+        success = (success and Up.shape == X.shape
+                   and np.allclose(Up, U) and np.allclose(Vp, V))
+    msg = "Threaded transform differs from the plain transform!"
+    assert success, msg
+
+
+def test_loop_kernels_agree():
+    # Every fused loop kernel should pass the check against NumPy.
+    from variations import _registry, VariationInfo, _verify_compiled
+    import variation_kernels
+
+    success = True
+    for name, info in _registry.items():
+        loop = VariationInfo(name, info.func, info.polar, variation_kernels.LOOPS[name])
+        success = success and _verify_compiled(loop)
+    msg = "A loop kernel disagrees with its NumPy kernel!"
+    assert success, msg
+
+
+def test_register_variation():
+    # A new variation works by name, and a wrong compiled kernel is dropped.
+    import warnings
+    from variations import _registry, register_variation
+
+    def spherical(x, y, r=None, theta=None, out=None, work=None):
+        r2 = x**2 + y**2
+        return x / r2, y / r2
+
+    def wrong(x, y, out):
+        out[0] = x
+        out[1] = y
+
+    register_variation("spherical", spherical, compiled=wrong)
+    try:
+        x = np.random.uniform(0.5, 1, 100)
+        y = np.random.uniform(0.5, 1, 100)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            u, v = Variations(x, y, "spherical").transform(block=10)
+        success = (np.allclose(u, x / (x**2 + y**2)) and len(caught) == 1
+                   and _registry["spherical"].compiled is None)
+    finally:
+        del _registry["spherical"]
+        Variations.names.remove("spherical")
+    msg = "Registered variation not used or wrong kernel not dropped!"
+    assert success, msg
+
+
+def test_stream_into_render():
+    # Streaming the variation into the renderer matches transforming X_next.
+    from chaos_game import ChaosGame
+    from density import DensityGrid
+
+    extent = (-1, 1, -1, 1)
+    f = ChaosGame(4, 1 / 3)
+    f._starting_point()
+    np.random.seed(4)
+    f.iterate(20000)
+    u, v = Variations(None, None, "disc").from_chaos_game(f, "disc")
+    expected = DensityGrid(extent, 100)
+    expected.add(np.column_stack((u, -v)))
+
+    np.random.seed(4)
+    grid = f.render(20000, width=100, extent=extent, chunk=3000,
+                    stage=lambda chunks: Variations.stream(chunks, "disc"))
+    success = grid.total == expected.total and np.array_equal(grid.counts, expected.counts)
+
+    # Without an extent the window follows the transformed points.
+    f._starting_point()
+    for name in ["swirl", "disc"]:
+        grid = f.render(20000, width=50, stage=lambda chunks: Variations.stream(chunks, name))
+        success = success and grid.total > 0.98 * 20000
+    msg = "Streamed variation differs from from_chaos_game!"
+    assert success, msg
+
+
+def test_transform_with_loop_kernels(monkeypatch):
+    # With the loop kernels registered as compiled, as with Numba installed,
+    # transform() takes the blocked kernel path for 1-D and 2-D input.
+    from variations import _registry
+    import variation_kernels
+
+    for name, info in _registry.items():
+        monkeypatch.setattr(info, "compiled", variation_kernels.LOOPS[name])
+        monkeypatch.setattr(info, "verified", False)
+    x = np.random.uniform(-1, 1, 500)
+    y = np.random.uniform(-1, 1, 500)
+    X, Y = np.meshgrid(np.linspace(-1, 1, 20), np.linspace(-1.1, 0.9, 25))
+    success = True
+    for name in Variations.names:
+        for a, b in [(x, y), (X, Y)]:
+            expected = Variations(a, b, name)._func(a, b)
+            for block, workers in [(None, None), (64, None), (None, 2), (64, 2)]:
+                var = Variations(a, b, name)
+                u, v = var.transform(block=block, workers=workers)
+                success = (success and var._compiled() is not None and u.shape == a.shape
+                           and np.allclose(u, expected[0]) and np.allclose(v, expected[1]))
+    msg = "Transform with the loop kernels differs from the NumPy kernels!"
+    assert success, msg
@@ -0,0 +1,129 @@
+"""
+Fused loop versions of the variations in variations.py.
+
+Every loop computes u and v for one point at a time, without the
+temporaries of the NumPy version, and writes them into out of shape
+(2, N). With Numba installed the loops are compiled and picked up by
+Variations automatically; without it compile_kernel gives None and the
+NumPy kernels are used. The compiled loops release the GIL, so
+Variations.transform(workers=...) runs them in parallel threads.
+"""
+import math
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def compile_kernel(loop):
+    """
+    Function compiling a loop kernel with Numba.
+
+    Arguments:
+    ----------
+        loop (callable): loop(x, y, out)
+
+    Returns:
+    --------
+        [callable]: the compiled kernel, or None without Numba
+    """
+    if numba is None:
+        return None
+    return numba.njit(cache=False, nogil=True, error_model="numpy")(loop)
+
+
+def linear_loop(x, y, out):
+    for i in range(x.shape[0]):
+        out[0, i] = x[i]
+        out[1, i] = y[i]
+
+
+def handkerchief_loop(x, y, out):
+    for i in range(x.shape[0]):
+        r = math.hypot(x[i], y[i])
+        theta = math.atan2(y[i], x[i])
+        out[0, i] = r * math.sin(theta + r)
+        out[1, i] = r * math.cos(theta - r)
+
+
+def swirl_loop(x, y, out):
+    for i in range(x.shape[0]):
+        r2 = x[i] * x[i] + y[i] * y[i]
+        s = math.sin(r2)
+        c = math.cos(r2)
+        out[0, i] = x[i] * s - y[i] * c
+        out[1, i] = x[i] * c + y[i] * s
+
+
+def disc_loop(x, y, out):
+    for i in range(x.shape[0]):
+        r = math.hypot(x[i], y[i])
+        t = math.atan2(y[i], x[i]) / math.pi
+        out[0, i] = t * math.sin(math.pi * r)
+        out[1, i] = t * math.cos(math.pi * r)
+
+
+def heart_loop(x, y, out):
+    for i in range(x.shape[0]):
+        r = math.hypot(x[i], y[i])
+        tr = math.atan2(y[i], x[i]) * r
+        out[0, i] = r * math.sin(tr)
+        out[1, i] = -r * math.cos(tr)
+
+
+def ex_loop(x, y, out):
+    for i in range(x.shape[0]):
+        r = math.hypot(x[i], y[i])
+        theta = math.atan2(y[i], x[i])
+        p0 = math.sin(theta + r)
+        p1 = math.cos(theta - r)
+        p0 = p0 * p0 * p0
+        p1 = p1 * p1 * p1
+        out[0, i] = r * (p0 + p1)
+        out[1, i] = r * (p0 - p1)
+
+
+def hyperbolic_loop(x, y, out):
+    for i in range(x.shape[0]):
+        r = math.hypot(x[i], y[i])
+        theta = math.atan2(y[i], x[i])
+        s = math.sin(theta)
+        if r == 0:
+            out[0, i] = math.nan if s == 0 else math.copysign(math.inf, s)
+        else:
+            out[0, i] = s / r
+        out[1, i] = r * math.cos(theta)
+
+
+def power_loop(x, y, out):
+    for i in range(x.shape[0]):
+        r = math.hypot(x[i], y[i])
+        theta = math.atan2(y[i], x[i])
+        s = math.sin(theta)
+        if r == 0 and s < 0:
+            rs = math.inf
+        else:
+            rs = r ** s
+        out[0, i] = rs * math.cos(theta)
+        out[1, i] = rs * s
+
+
+def fisheye_loop(x, y, out):
+    for i in range(x.shape[0]):
+        f = 2 / (math.hypot(x[i], y[i]) + 1)
+        out[0, i] = f * y[i]
+        out[1, i] = f * x[i]
+
+
+LOOPS = {
+    "linear": linear_loop,
+    "handkerchief": handkerchief_loop,
+    "swirl": swirl_loop,
+    "disc": disc_loop,
+    "heart": heart_loop,
+    "ex": ex_loop,
+    "hyperbolic": hyperbolic_loop,
+    "power": power_loop,
+    "fisheye": fisheye_loop,
+}
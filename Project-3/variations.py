@@ -1,9 +1,177 @@
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import matplotlib.pyplot as plt
 from chaos_game import ChaosGame
+import variation_kernels
+
+
+def _polar(x, y, r=None, theta=None):
+    """
+    Function giving the polar coordinates of the points, computing only
+    the ones that were not passed in.
+
+    Parameters:
+    ----------
+
+    x, y : array
+    Cartesian coordinates.
+
+    r, theta : array or None
+    Precomputed radius and angle.
+    """
+    if r is None:
+        r = np.hypot(x, y)
+    if theta is None:
+        theta = np.arctan2(y, x)
+    return r, theta
+
+
+def _buffers(x, out=None, work=None):
+    """
+    Function giving the output and scratch buffers of a kernel,
+    allocating the ones that were not passed in. They get the floating
+    type of x, so float32 points stay float32.
+
+    Parameters:
+    ----------
+
+    x : array
+    Points the kernel works on.
+
+    out : array or None
+    Output of shape (2,) + x.shape.
+
+    work : array or None
+    Scratch space of shape (2,) + x.shape.
+    """
+    dtype = np.result_type(x, 1.0)
+    if out is None:
+        out = np.empty((2,) + np.shape(x), dtype=dtype)
+    if work is None:
+        work = np.empty((2,) + np.shape(x), dtype=dtype)
+    return out, work
+
+
+def _call(func, x, y, r, theta, out, work):
+    """
+    Function running a kernel into out. Kernels that return new arrays
+    instead of writing into out, e.g. simple registered ones, get their
+    result copied in.
+
+    Parameters:
+    ----------
+
+    func : callable
+    The kernel.
+
+    x, y, r, theta, out, work :
+    Passed on to the kernel.
+    """
+    u, v = func(x, y, r=r, theta=theta, out=out, work=work)
+    if not np.shares_memory(u, out[0]):
+        out[0] = u
+    if not np.shares_memory(v, out[1]):
+        out[1] = v
+
+
+class VariationInfo:
+    """
+    ==============================================
+    Class VariationInfo holding a registered variation
+    and its metadata.
+    ==============================================
+    """
+    def __init__(self, name, func, polar=False, compiled=None):
+        """
+        Constructs all necessary attributes for the info object
+
+        Parameters:
+        ----------
+
+        name : string
+        Name the variation is looked up by.
+
+        func : callable
+        NumPy reference kernel func(x, y, r=None, theta=None, out=None, work=None)
+        returning u and v, preferably written into out.
+
+        polar : bool
+        True if func uses the polar coordinates r and theta, so they
+        can be computed once and passed in.
+
+        compiled : callable or None
+        Optional fused kernel compiled(x, y, out), used instead of func
+        once it has been checked to agree with it.
+        """
+        self.name = name
+        self.func = func
+        self.polar = polar
+        self.compiled = compiled
+        self.verified = False
+
+
+_registry = {}
+
+
+def register_variation(name, func, polar=False, compiled=None, replace=False):
+    """
+    Function adding a variation to the registry, so it can be used by
+    name in Variations without editing the class.
+
+    Parameters:
+    ----------
+
+    name, func, polar, compiled :
+    See VariationInfo.
+
+    replace : bool
+    True allows replacing a variation that is already registered.
+    """
+    if name in _registry and not replace:
+        raise ValueError(f"Variation {name} is already registered!")
+    _registry[name] = VariationInfo(name, func, polar, compiled)
+    if name not in Variations.names:
+        Variations.names.append(name)
+    return _registry[name]
+
+
+def _verify_compiled(info, tol=1e-9):
+    """
+    Function checking a compiled kernel against the NumPy reference on
+    random points, including the origin. A kernel that disagrees is
+    dropped with a warning, so the reference is used instead.
+
+    Parameters:
+    ----------
+
+    info : VariationInfo
+    The variation to check.
+
+    tol : float
+    Relative and absolute tolerance of the comparison.
+    """
+    rng = np.random.default_rng(1910)
+    x = np.append(rng.uniform(-2, 2, 256), 0.0)
+    y = np.append(rng.uniform(-2, 2, 256), 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        expected = np.array(info.func(x, y), dtype=float)
+        computed = np.empty((2, len(x)))
+        info.compiled(x, y, computed)
+    if not np.allclose(computed, expected, rtol=tol, atol=tol, equal_nan=True):
+        warnings.warn(f"Compiled {info.name} kernel disagrees with NumPy, not using it.")
+        info.compiled = None
+    info.verified = True
+    return info.compiled is not None
+
 
 class Variations:
-    def __init__(self, x, y, name):
+    names = []
+    use_compiled = True
+
+    def __init__(self, x, y, name, dtype=None):
         """
         Constructor that takes parameter x, y and name.
 
@@ -18,7 +186,8 @@ class Variations:
 
         name : string
         A string with the name of the transformation we want to use.
-        The name has to match one of these names:
+        The name has to be registered, see register_variation. The
+        built-in names are:
             -   linear
             -   handkerchief
             -   swirl
@@ -28,15 +197,23 @@ class Variations:
             -   hyperbolic
             -   power
             -   fisheye
+
+        dtype : data-type, optional
+        Floating type of the computation, e.g. np.float32 to halve the
+        memory traffic of large transforms.
         """
+        if dtype is not None:
+            x = np.asarray(x, dtype=dtype); y = np.asarray(y, dtype=dtype)
         self.x = x; self.y = y; self.name = name
-        names = ["linear", "handkerchief", "swirl", "disc", "heart", "ex", "hyperbolic", "power", "fisheye"]
-        assert name in names, "Incorrect transformation name."
-        self._func = getattr(Variations, name)
+        assert name in _registry, "Incorrect transformation name."
+        self._info = _registry[name]
+        self._func = self._info.func
 
+    # All kernels below write into out (2, N) and use work (2, N) as
+    # scratch, allocating them only when they are not passed in.
 
     @staticmethod
-    def linear(x, y):
+    def linear(x, y, r=None, theta=None, out=None, work=None):
         """
         Method for linear transformation.
 
@@ -48,11 +225,20 @@ class Variations:
 
         y : list
         A list of y-values to be transformed.
+
+        r, theta : array, optional
+        Precomputed polar coordinates of the points.
+
+        out, work : array, optional
+        Output and scratch buffers of shape (2, N).
         """
-        return x, y
+        if out is None:
+            return x, y
+        out[0] = x; out[1] = y
+        return out[0], out[1]
 
     @staticmethod
-    def handkerchief(x, y):
+    def handkerchief(x, y, r=None, theta=None, out=None, work=None):
         """
         Method for handkerchief transformation.
 
@@ -64,13 +250,21 @@ class Variations:
 
         y : list
         A list of y-values to be transformed.
+
+        r, theta : array, optional
+        Precomputed polar coordinates of the points.
+
+        out, work : array, optional
+        Output and scratch buffers of shape (2, N).
         """
-        r = np.sqrt(x**2 + y**2)
-        theta = np.arctan2(y, x)
-        return r*np.sin(theta+r), r*np.cos(theta - r)
+        r, theta = _polar(x, y, r, theta)
+        (u, v), work = _buffers(x, out, work)
+        np.add(theta, r, out=u); np.sin(u, out=u); u *= r
+        np.subtract(theta, r, out=v); np.cos(v, out=v); v *= r
+        return u, v
 
     @staticmethod
-    def swirl(x, y):
+    def swirl(x, y, r=None, theta=None, out=None, work=None):
         """
         Method for swirl transformation.
 
@@ -82,12 +276,25 @@ class Variations:
 
         y : list
         A list of y-values to be transformed.
+
+        r, theta : array, optional
+        Precomputed polar coordinates of the points.
+
+        out, work : array, optional
+        Output and scratch buffers of shape (2, N).
         """
-        r = np.sqrt(x**2 + y**2)
-        return x*np.sin(r**2) - y*np.cos(r**2), x*np.cos(r**2) + y*np.sin(r**2)
+        (u, v), (s, c) = _buffers(x, out, work)
+        if r is None:
+            np.multiply(x, x, out=s); np.multiply(y, y, out=c); s += c
+        else:
+            np.multiply(r, r, out=s)
+        np.cos(s, out=c); np.sin(s, out=s)
+        np.multiply(x, s, out=u); np.multiply(y, c, out=v); u -= v
+        np.multiply(x, c, out=v); np.multiply(y, s, out=c); v += c
+        return u, v
 
     @staticmethod
-    def disc(x, y):
+    def disc(x, y, r=None, theta=None, out=None, work=None):
         """
         Method for disc transformation.
 
@@ -99,13 +306,22 @@ class Variations:
 
         y : list
         A list of y-values to be transformed.
+
+        r, theta : array, optional
+        Precomputed polar coordinates of the points.
+
+        out, work : array, optional
+        Output and scratch buffers of shape (2, N).
         """
-        r = np.sqrt(x**2 + y**2)
-        theta = np.arctan2(y, x)
-        return (theta/np.pi)*np.sin(np.pi*r), (theta/np.pi)*np.cos(np.pi*r)
+        r, theta = _polar(x, y, r, theta)
+        (u, v), work = _buffers(x, out, work)
+        np.multiply(r, np.pi, out=u); np.cos(u, out=v); np.sin(u, out=u)
+        np.divide(theta, np.pi, out=work[0])
+        u *= work[0]; v *= work[0]
+        return u, v
 
     @staticmethod
-    def heart(x, y):
+    def heart(x, y, r=None, theta=None, out=None, work=None):
         """
         Method for heart transformation.
 
@@ -117,13 +333,21 @@ class Variations:
 
         y : list
         A list of y-values to be transformed.
+
+        r, theta : array, optional
+        Precomputed polar coordinates of the points.
+
+        out, work : array, optional
+        Output and scratch buffers of shape (2, N).
         """
-        r = np.sqrt(x**2 + y**2)
-        theta = np.arctan2(y, x)
-        return r*np.sin(theta*r), -r*np.cos(theta*r)
+        r, theta = _polar(x, y, r, theta)
+        (u, v), work = _buffers(x, out, work)
+        np.multiply(theta, r, out=u); np.cos(u, out=v); np.sin(u, out=u)
+        u *= r; v *= r; np.negative(v, out=v)
+        return u, v
 
     @staticmethod
-    def ex(x, y):
+    def ex(x, y, r=None, theta=None, out=None, work=None):
         """
         Method for ex transformation.
 
@@ -135,14 +359,23 @@ class Variations:
 
         y : list
         A list of y-values to be transformed.
+
+        r, theta : array, optional
+        Precomputed polar coordinates of the points.
+
+        out, work : array, optional
+        Output and scratch buffers of shape (2, N).
         """
-        r = np.sqrt(x**2 + y**2)
-        theta = np.arctan2(y, x)
-        p0 = np.sin(theta+r); p1 = np.cos(theta-r)
-        return r*(p0**3+p1**3), r*(p0**3-p1**3)
+        r, theta = _polar(x, y, r, theta)
+        (u, v), (w, _) = _buffers(x, out, work)
+        np.add(theta, r, out=u); np.sin(u, out=u); np.multiply(u, u, out=w); u *= w
+        np.subtract(theta, r, out=v); np.cos(v, out=v); np.multiply(v, v, out=w); v *= w
+        np.subtract(u, v, out=w); u += v
+        u *= r; np.multiply(w, r, out=v)
+        return u, v
 
     @staticmethod
-    def hyperbolic(x, y):
+    def hyperbolic(x, y, r=None, theta=None, out=None, work=None):
         """
         Method for hyperbolic transformation.
 
@@ -154,13 +387,21 @@ class Variations:
 
         y : list
         A list of y-values to be transformed.
+
+        r, theta : array, optional
+        Precomputed polar coordinates of the points.
+
+        out, work : array, optional
+        Output and scratch buffers of shape (2, N).
         """
-        r = np.sqrt(x**2 + y**2)
-        theta = np.arctan2(y, x)
-        return np.sin(theta)/r, r*np.cos(theta)
+        r, theta = _polar(x, y, r, theta)
+        (u, v), work = _buffers(x, out, work)
+        np.sin(theta, out=u); u /= r
+        np.cos(theta, out=v); v *= r
+        return u, v
 
     @staticmethod
-    def power(x, y):
+    def power(x, y, r=None, theta=None, out=None, work=None):
         """
         Method for power transformation.
 
@@ -172,13 +413,21 @@ class Variations:
 
         y : list
         A list of y-values to be transformed.
+
+        r, theta : array, optional
+        Precomputed polar coordinates of the points.
+
+        out, work : array, optional
+        Output and scratch buffers of shape (2, N).
         """
-        r = np.sqrt(x**2 + y**2)
-        theta = np.arctan2(y, x)
-        return r**(np.sin(theta))*np.cos(theta), r**(np.sin(theta))*np.sin(theta)
+        r, theta = _polar(x, y, r, theta)
+        (u, v), work = _buffers(x, out, work)
+        np.sin(theta, out=v); np.power(r, v, out=u); v *= u
+        np.cos(theta, out=work[0]); u *= work[0]
+        return u, v
 
     @staticmethod
-    def fisheye(x, y):
+    def fisheye(x, y, r=None, theta=None, out=None, work=None):
         """
         Method for fisheye transformation.
 
@@ -190,19 +439,155 @@ class Variations:
 
         y : list
         A list of y-values to be transformed.
+
+        r, theta : array, optional
+        Precomputed polar coordinates of the points.
+
+        out, work : array, optional
+        Output and scratch buffers of shape (2, N).
         """
-        r = np.sqrt(x**2 + y**2)
-        return 2/(r+1)*y, 2/(r+1)*x
+        (u, v), (f, _) = _buffers(x, out, work)
+        if r is None:
+            np.hypot(x, y, out=f)
+        else:
+            f[...] = r
+        f += 1; np.divide(2, f, out=f)
+        np.multiply(f, y, out=u); np.multiply(f, x, out=v)
+        return u, v
 
-    def transform(self):
+    def transform(self, out=None, block=None, workers=None):
         """
         Method for transforming the given x- and y-values.
         Returns a list of transformed x-values and transformed y-values
+
+        Parameters:
+        ----------
+
+        out : array, optional
+        Buffer of shape (2,) + x.shape the result is written into.
+
+        block : int, optional
+        Number of points transformed at a time, x and y of any shape are
+        flattened into blocks. The polar coordinates
+        and scratch buffers are allocated once for one block and reused,
+        so the extra memory stays bounded whatever N is.
+
+        workers : int, optional
+        Number of threads. The blocks (2**16 points if block is not
+        given) are shared out over a thread pool, which runs in parallel
+        since the NumPy ufuncs release the GIL. Every thread keeps its
+        own scratch buffers and writes its blocks into out.
+
+        If the variation has a compiled kernel, it is checked against the
+        NumPy version on first use and then used for every block.
+        """
+        compiled = self._compiled()
+        if out is None and block is None and workers is None and compiled is None:
+            return self._func(self.x, self.y)
+        x = np.asarray(self.x); y = np.asarray(self.y)
+        if x.ndim == 0:
+            return self._func(x, y, out=out)
+
+        # Blocks run over the flattened points, out keeps the input shape.
+        x, y = np.broadcast_arrays(x, y)
+        shape = x.shape
+        x = x.ravel(); y = y.ravel()
+        N = len(x)
+        dtype = np.result_type(x, 1.0)
+        if out is None:
+            out = np.empty((2,) + shape, dtype=dtype)
+        elif out.shape != (2,) + shape:
+            raise ValueError(f"Out needs shape {(2,) + shape}!")
+        result = out
+        out = out.reshape(2, N)
+        if block is None:
+            block = N if workers is None else 2**16
+        size = max(1, min(block, N))
+        polar = self._info.polar and compiled is None
+        local = threading.local()
+
+        def run(start):
+            if not hasattr(local, "work"):
+                local.work = np.empty((2, size), dtype=dtype)
+                local.polar = np.empty((2, size), dtype=dtype) if polar else None
+            stop = min(start + size, N)
+            m = stop - start
+            if compiled is not None:
+                compiled(x[start:stop], y[start:stop], out[:, start:stop])
+                return
+            r = theta = None
+            if polar:
+                r = np.hypot(x[start:stop], y[start:stop], out=local.polar[0, :m])
+                theta = np.arctan2(y[start:stop], x[start:stop], out=local.polar[1, :m])
+            _call(self._func, x[start:stop], y[start:stop], r, theta,
+                  out[:, start:stop], local.work[:, :m])
+
+        starts = range(0, N, size)
+        if workers is None or workers == 1:
+            for start in starts:
+                run(start)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(run, starts))
+        if not np.shares_memory(out, result):
+            result[...] = out.reshape(result.shape)
+        return result[0], result[1]
+
+    def _compiled(self):
+        """
+        Method giving the compiled kernel of the variation, or None if
+        there is none, it is switched off with Variations.use_compiled,
+        or it failed the check against the NumPy kernel.
+        """
+        info = self._info
+        if not Variations.use_compiled or info.compiled is None:
+            return None
+        if np.result_type(np.asarray(self.x), 1.0) != np.float64:
+            return None
+        if not info.verified and not _verify_compiled(info):
+            return None
+        return info.compiled
+
+    @staticmethod
+    def transform_many(x, y, names, dtype=None):
         """
-        x, y = self._func(self.x, self.y)
-        return x, y
+        Method transforming the same points with several variations at
+        once. The polar coordinates are computed a single time and
+        shared by every variation that needs them.
+
+        Parameters:
+        ----------
+
+        x : array
+        The x-values to be transformed.
+
+        y : array
+        The y-values to be transformed.
+
+        names : list
+        Names of the transformations, see the constructor.
 
-    def from_chaos_game(self, instance, name):
+        dtype : data-type, optional
+        Floating type of the computation, float64 by default.
+
+        Returns an array of shape (len(names), 2, len(x)) with the u and
+        v values of every transformation.
+        """
+        for name in names:
+            assert name in _registry, "Incorrect transformation name."
+        infos = [_registry[name] for name in names]
+        dtype = float if dtype is None else dtype
+        x = np.asarray(x, dtype=dtype); y = np.asarray(y, dtype=dtype)
+        r = theta = None
+        if any(info.polar for info in infos):
+            r, theta = _polar(x, y)
+        out = np.empty((len(names), 2) + x.shape, dtype=dtype)
+        work = np.empty((2,) + x.shape, dtype=dtype)
+        for i, info in enumerate(infos):
+            _call(info.func, x, y, r, theta, out[i], work)
+        return out
+
+    def from_chaos_game(self, instance, name, steps=10000):
         """
         Method for that takes an instace from ChaosGame and a transformation name,
         and returns u and v values corresponding to the transformed
@@ -212,17 +597,54 @@ class Variations:
         ----------
 
         instance : chaos_game.ChaosGame class object
-        An instance of a ChaosGame object.
+        An instance of a ChaosGame object. Its points X_next are used,
+        and if it has not been iterated yet it is iterated here.
 
         name : string
         The name of the transformation you want to use.
-        """
 
-        x = instance.X
+        steps : int
+        Number of points if the instance still has to be iterated.
+        """
+        if getattr(instance, "X_next", None) is None:
+            instance._starting_point()
+            instance.iterate(steps)
+        x = instance.X_next
         var = Variations(x[:,0], -x[:,1], name)
         u, v = var.transform()
         return u, v
 
+    @staticmethod
+    def stream(chunks, name, block=None):
+        """
+        Generator applying a variation to a stream of chunks, e.g.
+        ChaosGame.chunks(), so the full untransformed trajectory is
+        never held in memory. The points are flipped like in
+        from_chaos_game and flipped back after the transform, which
+        gives the points (u, -v) as they are plotted.
+
+        Parameters:
+        ----------
+
+        chunks : iterable
+        Tuples whose first entry is an array of points of shape (m, 2),
+        the other entries (colors) are passed through.
+
+        name : str
+        Name of the variation, one of Variations.names.
+
+        block : int, optional
+        Block size of the transform, see transform.
+
+        Yields tuples like the input, with the transformed points.
+        """
+        for chunk in chunks:
+            X = chunk[0]
+            out = np.empty((2, len(X)), dtype=np.result_type(X, 1.0))
+            Variations(X[:, 0], -X[:, 1], name).transform(out=out, block=block)
+            np.negative(out[1], out=out[1])
+            yield (out.T,) + tuple(chunk[1:])
+
     def linear_combination_wrap(self, V1, V2):
         """
         Method for combining two transformations to one.
@@ -242,6 +664,72 @@ class Variations:
             return w*V2[0] + (1-w)*V1[0], (w*V2[1] + (1-w)*V1[1])
         return V12
 
+    def linear_combination_sweep(self, V1, V2, weights):
+        """
+        Method blending two transformations for a whole vector of
+        weights in one broadcast operation.
+
+        Parameters:
+        ----------
+
+        V1 : tuple
+        Tuple with the u and v values of the variation you want to
+        change from.
+
+        V2 : tuple
+        Tuple with the u and v values of the variation you want to
+        change to.
+
+        weights : array
+        The weights w, 0 gives V1 and 1 gives V2.
+
+        Returns an array of shape (len(weights), 2, N) where frame i
+        holds the u and v values for weights[i].
+        """
+        V1 = np.asarray(V1); V2 = np.asarray(V2)
+        w = np.asarray(weights)
+        dtype = np.result_type(V1, V2, w, 1.0)
+        w = w.astype(dtype).reshape(-1, 1, 1)
+        return V1 + w*(V2.astype(dtype) - V1)
+
+    def linear_combination_frames(self, V1, V2, weights):
+        """
+        Generator blending two transformations one weight at a time,
+        e.g. for a video encoder. Every frame is written into the same
+        buffer, so memory stays at one frame; copy a frame to keep it.
+
+        Parameters:
+        ----------
+
+        V1 : tuple
+        Tuple with the u and v values of the variation you want to
+        change from.
+
+        V2 : tuple
+        Tuple with the u and v values of the variation you want to
+        change to.
+
+        weights : array
+        The weights w, 0 gives V1 and 1 gives V2.
+
+        Yields an array of shape (2, N) with the u and v values.
+        """
+        V1 = np.asarray(V1); V2 = np.asarray(V2)
+        weights = np.asarray(weights)
+        D = np.subtract(V2, V1, dtype=np.result_type(V1, V2, weights, 1.0))
+        frame = np.empty_like(D)
+        for w in weights:
+            np.multiply(D, w, out=frame)
+            frame += V1
+            yield frame
+
+
+for _name, _polar_input in [("linear", False), ("handkerchief", True), ("swirl", False),
+                            ("disc", True), ("heart", True), ("ex", True),
+                            ("hyperbolic", True), ("power", True), ("fisheye", False)]:
+    register_variation(_name, getattr(Variations, _name), polar=_polar_input,
+                       compiled=variation_kernels.compile_kernel(variation_kernels.LOOPS[_name]))
+
 
 if __name__ == "__main__":
 
@@ -255,14 +743,14 @@ if __name__ == "__main__":
 
 
     transformations = ["linear", "handkerchief", "swirl", "disc", "heart", "ex", "hyperbolic", "power", "fisheye"]
-    variations = [Variations(x_values, y_values, version) for version in transformations]
+    UV = Variations.transform_many(x_values, y_values, transformations)
 
     fig, axs = plt.subplots(3, 3, figsize=(9, 9))
-    for i, (ax, variation) in enumerate(zip(axs.flatten(), variations)):
-        u, v = variation.transform()
+    for i, (ax, name) in enumerate(zip(axs.flatten(), transformations)):
+        u, v = UV[i]
 
         ax.plot(u, -v, markersize=1, marker=",", linestyle="", color="black")
-        ax.set_title(variation.name)
+        ax.set_title(name)
         ax.axis("off")
 
     fig.savefig("figures/variations_4b.png")
@@ -287,7 +775,7 @@ if __name__ == "__main__":
         ngon = ChaosGame(n, r)
         u, v = var.from_chaos_game(ngon, variation)
 
-        ax.scatter(u, -v, s=0.2, marker=".", c=ngon._gradient_color())
+        ax.scatter(u, -v, s=0.2, marker=".", c=ngon.C)
         ax.set_title(variation)
         ax.axis("off")
 
@@ -311,7 +799,7 @@ if __name__ == "__main__":
     for ax, w in zip(axs.flatten(), coeffs):
         u, v = variation12(w)
 
-        ax.scatter(u, -v, s=0.2, marker=".", c=ngon.gradient_color())
+        ax.scatter(u, -v, s=0.2, marker=".", c=ngon.C)
         ax.set_title(f"value = {w:.2f}")
         ax.axis("off")
 